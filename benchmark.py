@@ -0,0 +1,268 @@
+#!/usr/bin/env pypy
+# Search benchmarks on a fixed corpus of positions. Every position is searched
+# at a fixed depth with each algorithm and heuristic, and the speed of is_end
+# and of the heuristics is measured on the same positions. Results are written
+# as JSON; --compare flags every speed that dropped by more than --threshold
+# on average over the corpus against a saved run and exits with status 1.
+# Every search is repeated and its fastest run kept, and the speeds are
+# taken relative to a fixed calibration loop timed next to them.
+#
+#   pypy benchmark.py --output baseline.json
+#   pypy benchmark.py --compare baseline.json
+import argparse
+import io
+import json
+import math
+import platform
+import random
+import sys
+import time
+
+from ordering import MoveOrdering
+from skeleton_tictactoe import Game
+
+# (name, n, s, blocks, stones already played, alphabeta depth, minimax depth).
+# The stones are drawn from a fixed seed so every run and interpreter gets the
+# same boards.
+CORPUS = [
+    ('3x3-open', 3, 3, [], 0, 9, 9),
+    ('4x4-s3-block', 4, 3, [(0, 0)], 1, 8, 5),
+    ('4x4-s4', 4, 4, [], 3, 8, 5),
+    ('5x5-s4-centre-block', 5, 4, [(2, 2)], 6, 6, 4),
+    ('6x6-s4', 6, 4, [], 8, 7, 4),
+    ('7x7-s4-corners', 7, 4, [(0, 0), (6, 6)], 4, 5, 3),
+    ('8x8-s5', 8, 5, [], 10, 5, 3),
+    ('9x9-s5-blocks', 9, 5, [(4, 4), (0, 8), (8, 0)], 12, 5, 3),
+    ('10x10-s5', 10, 5, [], 12, 4, 3),
+    ('10x10-s4-blocks', 10, 4, [(1, 1), (3, 5), (5, 3), (8, 8)], 16, 5, 3),
+]
+ALGORITHMS = (('minimax', Game.MINIMAX), ('alphabeta', Game.ALPHABETA), ('pvs', Game.PVS))
+HEURISTICS = (1, 2)
+
+
+def make_game(n, s, blocks, depth, e):
+    params = {'n': n, 's': s, 'b_positions': blocks, 'd1': depth, 'd2': depth, 't': 10 ** 6,
+              'a1': True, 'a2': True, 'e1': e, 'e2': e, 'trace': io.StringIO()}
+    game = Game(recommend=False, params=params, book=None, weights=None)
+    # count the nodes but leave the timers out of the measured time
+    game.stats.timing = False
+    return game
+
+
+# Plays stones random moves from a fixed seed, never ending the game
+def setup_position(game, stones, seed):
+    rng = random.Random(seed)
+    for _ in range(stones):
+        cells = game.board.empty_cells()
+        rng.shuffle(cells)
+        for (x, y) in cells:
+            game.board.place(x, y, game.player_turn)
+            if game.is_end() is None:
+                break
+            game.board.remove(x, y)
+        game.switch_player()
+
+
+# One search from empty tables and move ordering, so that every run of the
+# same position searches the same tree
+def search_once(game, algo):
+    game.tt.clear()
+    if game.ordering is not None:
+        game.ordering = MoveOrdering(game.n, game.lines)
+    game.stats.new_move()
+    start = time.perf_counter()
+    (x, y, h_result) = game.search(algo, max=game.player_turn == 'O')
+    return (x, y, h_result), time.perf_counter() - start, list(game.iterations)
+
+
+# The search is repeated for at least min_time seconds and min_runs runs and
+# the fastest run is kept, a single run of a few milliseconds is mostly noise
+def bench_search(game, algo, depth, min_time=0.5, min_runs=5):
+    game.d1 = depth
+    game.d2 = depth
+    runs = []
+    total = 0
+    while len(runs) < min_runs or total < min_time:
+        runs.append(search_once(game, algo))
+        total += runs[-1][1]
+    ((x, y, h_result), elapsed, iterations) = min(runs, key=lambda run: run[1])
+    evaluations = game.stats.total_evaluations()
+    nodes = game.stats.node_count
+    # Effective branching factor: growth of the node count between iterations
+    ratios = [b[1] / a[1] for (a, b) in zip(iterations, iterations[1:]) if a[1]]
+    time_to_depth = {}
+    seconds = 0
+    for (iteration_depth, _, iteration_seconds) in iterations:
+        seconds += iteration_seconds
+        time_to_depth[iteration_depth] = seconds
+    return {
+        'move': [x, y],
+        'value': h_result,
+        'depth': game.completed_depth,
+        'nodes': nodes,
+        'evaluations': evaluations,
+        'seconds': elapsed,
+        'runs': len(runs),
+        'nodes_per_sec': nodes / elapsed if elapsed else 0,
+        'evaluations_per_sec': evaluations / elapsed if elapsed else 0,
+        'time_to_depth': time_to_depth,
+        'branching_factor': sum(ratios) / len(ratios) if ratios else None,
+    }
+
+
+# Calls per second of function: the best of the batches of 100 calls made
+# over at least min_time seconds, as for the searches the fastest batch is
+# the one least disturbed by the rest of the machine
+def rate(function, min_time=0.2):
+    best = 0
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        for _ in range(100):
+            function()
+        end = time.perf_counter()
+        if end > batch_start and 100 / (end - batch_start) > best:
+            best = 100 / (end - batch_start)
+        if end - start >= min_time:
+            return best
+
+
+# Fixed pure Python work that no change to the engine can speed up or slow
+# down: its rate measures the machine at the time a position is benchmarked
+def calibration_work():
+    total = 0
+    cells = {}
+    for i in range(200):
+        total += (i * 7919) & 0xffff
+        cells[i & 31] = total
+    return total
+
+
+def bench_functions(game):
+    cells = game.board.empty_cells()
+    (x, y) = cells[len(cells) // 2]
+
+    def make_unmake():
+        game.board.place(x, y, game.player_turn)
+        game.is_end()
+        game.board.remove(x, y)
+
+    return {
+        'is_end_per_sec': rate(game.is_end),
+        'make_unmake_per_sec': rate(make_unmake),
+        'e1_per_sec': rate(game.heuristic_e1),
+        'e2_per_sec': rate(game.heuristic_e2),
+        'e2_full_per_sec': rate(lambda: game.evaluator.score(game.board)),
+    }
+
+
+def run(corpus, min_time, search_time):
+    results = []
+    for (name, n, s, blocks, stones, depth, minimax_depth) in corpus:
+        for e in HEURISTICS:
+            game = make_game(n, s, blocks, depth, e)
+            setup_position(game, stones, seed=sum(map(ord, name)))
+            entry = {'position': name, 'heuristic': e, 'x': game.board.x, 'o': game.board.o}
+            calibration = rate(calibration_work)
+            entry['functions'] = bench_functions(game) if min_time else {}
+            for (algo_name, algo) in ALGORITHMS:
+                algo_depth = depth
+                if algo == Game.MINIMAX:
+                    algo_depth = minimax_depth
+                entry[algo_name] = bench_search(game, algo, algo_depth, search_time)
+                print(F"{name:22} e{e} {algo_name:9} depth {algo_depth}: "
+                      F"{entry[algo_name]['nodes']:8} nodes {entry[algo_name]['seconds']:8.3f}s "
+                      F"{entry[algo_name]['nodes_per_sec']:10.0f} nodes/s", file=sys.stderr)
+            entry['calibration'] = (calibration + rate(calibration_work)) / 2
+            results.append(entry)
+    return {
+        'implementation': platform.python_implementation(),
+        'version': platform.python_version(),
+        'results': results,
+    }
+
+
+# Speeds that may only go down by threshold, higher is better
+SPEEDS = ('nodes_per_sec', 'evaluations_per_sec')
+FUNCTION_SPEEDS = ('is_end_per_sec', 'make_unmake_per_sec', 'e1_per_sec', 'e2_per_sec', 'e2_full_per_sec')
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    # label -> (new / old speed, position) of every position
+    ratios = {}
+    old_results = {(r['position'], r['heuristic']): r for r in baseline['results']}
+    for new in current['results']:
+        old = old_results.get((new['position'], new['heuristic']))
+        if old is None:
+            continue
+        if (old['x'], old['o']) != (new['x'], new['o']):
+            regressions.append(F"{new['position']} e{new['heuristic']}: position differs from the baseline")
+            continue
+        # The speeds are compared relative to the machine speed measured next
+        # to each of them, the load of a shared machine changes from run to run
+        scale = 1
+        if old.get('calibration') and new.get('calibration'):
+            scale = old['calibration'] / new['calibration']
+        checks = []
+        for (algo_name, _) in ALGORITHMS:
+            if algo_name in old and algo_name in new:
+                for speed in SPEEDS:
+                    checks.append((F'{algo_name} {speed}', old[algo_name][speed], new[algo_name][speed]))
+        for speed in FUNCTION_SPEEDS:
+            if speed in old.get('functions', {}) and speed in new.get('functions', {}):
+                checks.append((speed, old['functions'][speed], new['functions'][speed]))
+        for (label, old_value, new_value) in checks:
+            if old_value and new_value:
+                ratios.setdefault(label, []).append((new_value * scale / old_value,
+                                                     F"{new['position']} e{new['heuristic']}"))
+    # A single speed moves by more than the threshold from one run to the
+    # next, the geometric mean of a speed over the corpus doesn't
+    for (label, values) in ratios.items():
+        mean = math.exp(sum(math.log(ratio) for (ratio, _) in values) / len(values))
+        if mean < 1 - threshold:
+            (worst, position) = min(values)
+            regressions.append(F"{label}: {(mean - 1) * 100:+.1f}% over {len(values)} positions, "
+                               F"worst {position} {(worst - 1) * 100:+.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the search on a fixed corpus of positions.')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default 0.1)')
+    parser.add_argument('--search-time', type=float, default=0.5,
+                        help='seconds spent repeating each search, the fastest run counts (default 0.5)')
+    parser.add_argument('--positions', nargs='+', help='only run these positions of the corpus')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds spent timing each function, 0 skips them (default 0.2)')
+    args = parser.parse_args()
+
+    corpus = CORPUS
+    if args.positions:
+        corpus = [entry for entry in CORPUS if entry[0] in args.positions]
+    current = run(corpus, args.min_time, args.search_time)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['implementation'] != current['implementation']:
+            print(F"Warning: baseline ran under {baseline['implementation']}, "
+                  F"this run under {current['implementation']}", file=sys.stderr)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(F'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+import random
+
+from lines import LineIndex
+from symmetry import Symmetry
+
+# Zobrist keys are drawn from a fixed seed so that the same position hashes
+# to the same key in every process
+ZOBRIST_SEED = 472
+_zobrist_keys = {}
+
+
+def zobrist_keys(n):
+    if n not in _zobrist_keys:
+        rng = random.Random(ZOBRIST_SEED + n)
+        cells = n * (n + 1)
+        _zobrist_keys[n] = ([rng.getrandbits(64) for _ in range(cells)],
+                            [rng.getrandbits(64) for _ in range(cells)])
+    return _zobrist_keys[n]
+
+
+class Board:
+    # Bitboard for an n x n board (n <= 10). Every piece type gets its own
+    # integer bitmask. Cell (x, y) lives at bit x * (n + 1) + y: each column
+    # has one padding bit at the end so that shifted masks never wrap from
+    # one column into the next when looking for lines.
+    EMPTY = '.'
+    BLOCK = '-'
+    # XORed into the hash when O is the side to move
+    ZOBRIST_O_TO_MOVE = random.Random(ZOBRIST_SEED).getrandbits(64)
+
+    def __init__(self, n, s, b_positions=(), incremental=True, weights=None, symmetric=True):
+        self.n = n
+        self.s = s
+        self.stride = n + 1
+        self.x = 0
+        self.o = 0
+        self.blocks = 0
+        self.full = 0
+        for i in range(n):
+            for j in range(n):
+                self.full |= 1 << self.index(i, j)
+        for b in b_positions:
+            self.blocks |= 1 << self.index(b[0], b[1])
+        # Shift amounts for vertical, horizontal and both diagonal lines
+        self.directions = (1, self.stride, self.stride + 1, self.stride - 1)
+        # Empty cells, kept on every place/remove
+        self.empty = self.full & ~self.blocks
+        self.lines = LineIndex.get(n, s, b_positions)
+        # The end of game is tracked as moves are made and unmade: only lines
+        # through the last placed cell can have become a win
+        self.empty_count = bin(self.full & ~self.blocks).count('1')
+        self.result = None
+        self.history = []
+        # Windows still winnable by a player (holding stones of at most one
+        # of them) and, for every cell, the number of them through it. Cells
+        # on none are dead: a stone there changes nothing. When no window is
+        # left the game is a draw whatever is played.
+        self.live = len(self.lines.windows)
+        self.cell_live = [len(windows) for windows in self.lines.cell_windows]
+        self.dead = 0
+        for idx, windows in enumerate(self.lines.cell_windows):
+            if not windows:
+                self.dead |= 1 << idx
+        self.dead &= self.full
+        # Zobrist hash of the pieces on the board, blocks are part of the
+        # configuration and are not hashed
+        self.zobrist_x, self.zobrist_o = zobrist_keys(n)
+        self.hash = 0
+        # Hashes of the images of the position under the other symmetries of
+        # the block layout, the smallest of all is the canonical key
+        self.symmetry = Symmetry.get(n, b_positions)
+        self.image_hashes = []
+        self.image_zobrist_x = []
+        self.image_zobrist_o = []
+        if symmetric:
+            for perm in self.symmetry.perms[1:]:
+                self.image_hashes.append(0)
+                self.image_zobrist_x.append([self.zobrist_x[perm[idx]] for idx in range(len(perm))])
+                self.image_zobrist_o.append([self.zobrist_o[perm[idx]] for idx in range(len(perm))])
+        # Running heuristic scores, kept up to date on every place/remove:
+        # material is #X - #O (e1), e2_score is the window score of e2 kept
+        # from the number of X and O in every window of the line index
+        self.material = 0
+        self.incremental = incremental
+        if incremental:
+            if weights is None:
+                weights = [0] + [10 ** k for k in range(1, s + 1)]
+            self.weights = weights
+            self.count_x = [0] * len(self.lines.windows)
+            self.count_o = [0] * len(self.lines.windows)
+            self.e2_score = 0
+            # open_x[k] holds the windows with k X and no O for k = s - 2 and
+            # s - 1 (the other sets stay empty), open_o the same for O. They
+            # are what the threat detection looks at.
+            self.open_x = [set() for _ in range(s + 1)]
+            self.open_o = [set() for _ in range(s + 1)]
+
+    def index(self, x, y):
+        return x * self.stride + y
+
+    def coordinates(self, idx):
+        return divmod(idx, self.stride)
+
+    def get(self, x, y):
+        bit = 1 << self.index(x, y)
+        if self.x & bit:
+            return 'X'
+        elif self.o & bit:
+            return 'O'
+        elif self.blocks & bit:
+            return self.BLOCK
+        return self.EMPTY
+
+    def place(self, x, y, piece):
+        idx = self.index(x, y)
+        self.history.append(self.result)
+        if piece == 'X':
+            self.x |= 1 << idx
+            self.empty ^= 1 << idx
+            self.hash ^= self.zobrist_x[idx]
+            self.material += 1
+            bits = self.x
+            images = self.image_zobrist_x
+        else:
+            self.o |= 1 << idx
+            self.empty ^= 1 << idx
+            self.hash ^= self.zobrist_o[idx]
+            self.material -= 1
+            bits = self.o
+            images = self.image_zobrist_o
+        hashes = self.image_hashes
+        for k in range(len(hashes)):
+            hashes[k] ^= images[k][idx]
+        self.empty_count -= 1
+        if self.incremental:
+            won = self.update_windows(idx, piece, 1)
+        else:
+            won = self.line_through(bits, idx)
+            self.update_live(idx, bits, self.o if piece == 'X' else self.x, 1)
+        if self.result is None and won:
+            self.result = piece
+
+    def remove(self, x, y):
+        idx = self.index(x, y)
+        if (self.x >> idx) & 1:
+            self.hash ^= self.zobrist_x[idx]
+            self.material -= 1
+            piece = 'X'
+            images = self.image_zobrist_x
+        else:
+            self.hash ^= self.zobrist_o[idx]
+            self.material += 1
+            piece = 'O'
+            images = self.image_zobrist_o
+        hashes = self.image_hashes
+        for k in range(len(hashes)):
+            hashes[k] ^= images[k][idx]
+        if self.incremental:
+            self.update_windows(idx, piece, -1)
+        elif piece == 'X':
+            self.update_live(idx, self.x, self.o, -1)
+        else:
+            self.update_live(idx, self.o, self.x, -1)
+        bit = ~(1 << idx)
+        self.x &= bit
+        self.o &= bit
+        self.empty |= 1 << idx
+        self.empty_count += 1
+        self.result = self.history.pop()
+
+    # Key of the smallest image of the position and the symmetry giving it:
+    # symmetric positions share their canonical key
+    def canonical_key(self, o_to_move):
+        key = self.hash
+        image = 0
+        for k, h in enumerate(self.image_hashes, 1):
+            if h < key:
+                key = h
+                image = k
+        if o_to_move:
+            key ^= self.ZOBRIST_O_TO_MOVE
+        return key, image
+
+    # Symmetries that map the position onto itself
+    def stabilizer(self):
+        return [0] + [k for k, h in enumerate(self.image_hashes, 1) if h == self.hash]
+
+    # List of the empty (x, y) cells, filled into cells when given
+    def empty_cells(self, cells=None):
+        return self.mask_cells(self.empty, cells)
+
+    # List of the (x, y) cells of mask, filled into cells when given
+    def mask_cells(self, mask, cells=None):
+        if cells is None:
+            cells = []
+        else:
+            cells.clear()
+        while mask:
+            low = mask & -mask
+            cells.append(divmod(low.bit_length() - 1, self.stride))
+            mask ^= low
+        return cells
+
+    # The (x, y) cells of mask one at a time, lowest bit first
+    def iter_cells(self, mask):
+        stride = self.stride
+        while mask:
+            low = mask & -mask
+            yield divmod(low.bit_length() - 1, stride)
+            mask ^= low
+
+    # Cells at most distance cells away (in any direction) from a stone
+    def near_mask(self, distance):
+        near = self.x | self.o
+        for _ in range(distance):
+            grown = near
+            for d in self.directions:
+                grown |= (near << d) | (near >> d)
+            near = grown & self.full
+        return near
+
+    # Empty cells worth playing: the live ones near the stones already on
+    # the board, or all the live ones on an empty board or when distance is
+    # None. Dead cells only come back when nothing else is left.
+    def candidate_mask(self, distance=None):
+        live = self.empty & ~self.dead
+        if not live:
+            return self.empty
+        if distance is None:
+            return live
+        candidates = live & self.near_mask(distance)
+        if not candidates:
+            return live
+        return candidates
+
+    def count(self, piece):
+        if piece == 'X':
+            return bin(self.x).count('1')
+        return bin(self.o).count('1')
+
+    def has_line(self, bits):
+        for d in self.directions:
+            run = bits
+            for k in range(1, self.s):
+                run &= bits >> (k * d)
+                if not run:
+                    break
+            if run:
+                return True
+        return False
+
+    # Adds step (1 or -1) pieces to every window through idx and updates the
+    # e2 score, returns True when one of the windows is now full of piece
+    def update_windows(self, idx, piece, step):
+        weights = self.weights
+        count_x = self.count_x
+        count_o = self.count_o
+        score = self.e2_score
+        open_x = self.open_x
+        open_o = self.open_o
+        near = self.s - 2
+        won = False
+        for w in self.lines.cell_windows[idx]:
+            cx = count_x[w]
+            co = count_o[w]
+            closed = cx and co
+            if not co:
+                score -= weights[cx]
+                if cx >= near:
+                    open_x[cx].discard(w)
+            elif not cx:
+                score += weights[co]
+                if co >= near:
+                    open_o[co].discard(w)
+            if piece == 'X':
+                cx += step
+                count_x[w] = cx
+            else:
+                co += step
+                count_o[w] = co
+            if not co:
+                score += weights[cx]
+                if cx >= near:
+                    open_x[cx].add(w)
+                    if cx == self.s:
+                        won = True
+            elif not cx:
+                score -= weights[co]
+                if co >= near:
+                    open_o[co].add(w)
+                    if co == self.s:
+                        won = True
+            elif not closed:
+                self.close_window(w)
+            if closed and not (cx and co):
+                self.open_window(w)
+        self.e2_score = score
+        return won
+
+    # Same bookkeeping of the live windows as update_windows, from the
+    # bitmasks: own holds the stone on idx, which closes (step 1) or was the
+    # only one of its player closing (step -1) the windows through idx also
+    # holding other
+    def update_live(self, idx, own, other, step):
+        bit = 1 << idx
+        masks = self.lines.masks
+        for w in self.lines.cell_windows[idx]:
+            mask = masks[w]
+            if mask & other and own & mask == bit:
+                if step > 0:
+                    self.close_window(w)
+                else:
+                    self.open_window(w)
+
+    # Window w now holds stones of both players
+    def close_window(self, w):
+        self.live -= 1
+        cell_live = self.cell_live
+        for idx in self.lines.windows[w]:
+            cell_live[idx] -= 1
+            if not cell_live[idx]:
+                self.dead |= 1 << idx
+
+    # Window w holds stones of one player again
+    def open_window(self, w):
+        self.live += 1
+        cell_live = self.cell_live
+        for idx in self.lines.windows[w]:
+            if not cell_live[idx]:
+                self.dead ^= 1 << idx
+            cell_live[idx] += 1
+
+    # e2 scores of the positions after piece is placed on each of moves,
+    # from the window counts and without placing it
+    def child_scores(self, moves, piece):
+        weights = self.weights
+        cell_windows = self.lines.cell_windows
+        stride = self.stride
+        if piece == 'X':
+            (own, other, sign) = (self.count_x, self.count_o, 1)
+        else:
+            (own, other, sign) = (self.count_o, self.count_x, -1)
+        scores = []
+        for (x, y) in moves:
+            delta = 0
+            for w in cell_windows[x * stride + y]:
+                if not other[w]:
+                    k = own[w]
+                    delta += weights[k + 1] - weights[k]
+                elif not own[w]:
+                    delta += weights[other[w]]
+            scores.append(self.e2_score + sign * delta)
+        return scores
+
+    # For each of moves, True when placing piece there leaves a game going
+    # on with a window one stone short of s for either player
+    def child_threats(self, moves, piece):
+        s = self.s
+        if not self.incremental:
+            threats = []
+            for (x, y) in moves:
+                self.place(x, y, piece)
+                threats.append(self.status() is None and bool(self.open_windows('X', s - 1) or
+                                                              self.open_windows('O', s - 1)))
+                self.remove(x, y)
+            return threats
+        cell_windows = self.lines.cell_windows
+        stride = self.stride
+        if piece == 'X':
+            (own, other, own_open, other_open) = (self.count_x, self.count_o, self.open_x[s - 1], self.open_o[s - 1])
+        else:
+            (own, other, own_open, other_open) = (self.count_o, self.count_x, self.open_o[s - 1], self.open_x[s - 1])
+        if self.empty_count == 1:
+            return [False] * len(moves)
+        if not own_open and not other_open:
+            # Only a cell of a window holding s - 2 stones of piece and none
+            # of the other makes one
+            masks = self.lines.masks
+            near = 0
+            for w in (self.open_x if piece == 'X' else self.open_o)[s - 2]:
+                near |= masks[w]
+            return [bool(near >> (x * stride + y) & 1) for (x, y) in moves]
+        threats = []
+        for (x, y) in moves:
+            # The windows of the own side stay open unless one of them is
+            # completed, the ones of the other side through the cell close
+            threat = bool(own_open)
+            remaining = len(other_open)
+            for w in cell_windows[x * stride + y]:
+                if not other[w]:
+                    k = own[w]
+                    if k == s - 1:
+                        threat = False
+                        remaining = 0
+                        break
+                    if k == s - 2:
+                        threat = True
+                elif not own[w] and other[w] == s - 1:
+                    remaining -= 1
+            threats.append(threat or remaining > 0)
+        return threats
+
+    # Ids of the windows holding k pieces of piece and none of the other
+    # player, kept incrementally for k = s - 2 and s - 1
+    def open_windows(self, piece, k):
+        if self.incremental:
+            if piece == 'X':
+                return self.open_x[k]
+            return self.open_o[k]
+        if piece == 'X':
+            own = self.x
+            other = self.o
+        else:
+            own = self.o
+            other = self.x
+        return [w for w, mask in enumerate(self.lines.masks)
+                if not mask & other and bin(mask & own).count('1') == k]
+
+    # Cells (bit indices) where piece completes a line right away
+    def winning_cells(self, piece):
+        own = self.x if piece == 'X' else self.o
+        masks = self.lines.masks
+        cells = set()
+        for w in self.open_windows(piece, self.s - 1):
+            cells.add((masks[w] & ~own).bit_length() - 1)
+        return cells
+
+    # Cells where piece makes two different winning cells at once, which the
+    # other player can't both block. Only meaningful when neither player has
+    # a winning cell already.
+    def double_threats(self, piece):
+        own = self.x if piece == 'X' else self.o
+        masks = self.lines.masks
+        # cell -> the winning cells playing it would make
+        makes = {}
+        for w in self.open_windows(piece, self.s - 2):
+            empty = masks[w] & ~own
+            low = empty & -empty
+            a = low.bit_length() - 1
+            b = (empty ^ low).bit_length() - 1
+            makes.setdefault(a, set()).add(b)
+            makes.setdefault(b, set()).add(a)
+        return [cell for cell, wins in makes.items() if len(wins) > 1]
+
+    def line_through(self, bits, idx):
+        for mask in self.lines.cell_masks[idx]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    # incremental equivalent of winner(), the game is a draw as soon as no
+    # window can be won any more (a full board has none left)
+    def status(self):
+        if self.result is not None:
+            return self.result
+        elif not self.live:
+            return '.'
+        return None
+
+    # full rescan of the board
+    def winner(self):
+        if self.has_line(self.x):
+            return 'X'
+        elif self.has_line(self.o):
+            return 'O'
+        elif all(mask & self.x and mask & self.o for mask in self.lines.masks):
+            return '.'
+        return None
@@ -0,0 +1,232 @@
+#!/usr/bin/env pypy
+# On-disk position cache: an opening book and, for small configurations, a
+# full solution of the game. There is one file per (n, s, blocks)
+# configuration holding an open-addressing hash table of fixed-size records
+# keyed by the canonical Zobrist key of the position (side to move included,
+# symmetric positions share one record, moves are stored in the frame of the
+# canonical image, see Board.canonical_key). The file
+# is memory-mapped, a lookup reads a few records and nothing is loaded at
+# startup. Files are built offline:
+#
+#   pypy book.py solve --n 3 --s 3
+#   pypy book.py openings --n 7 --s 4 --blocks "0,0 6,6" --plies 2 --depth 4 --e 2
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from board import Board
+
+MAGIC = b'TTTBOOK2'
+# magic, n, s, number of slots, blocks bitmask (low and high 64 bits)
+HEADER = struct.Struct('<8sBBxxIQQ')
+# key, move (x * n + y, NO_MOVE if none), kind, search depth, value
+RECORD = struct.Struct('<QBBBxi')
+NO_MOVE = 255
+
+# Kinds of records
+SOLVED = 1
+OPENING = 2
+KINDS = {SOLVED: 'solved', OPENING: 'opening'}
+
+DEFAULT_DIRECTORY = 'books'
+
+
+def book_filename(directory, n, s, b_positions):
+    blocks = Board(n, s, b_positions).blocks
+    return os.path.join(directory, F'book-{n}-{s}-{blocks:x}.bin')
+
+
+def record_key(key):
+    # 0 marks an empty slot
+    return key or 1
+
+
+class PositionBook:
+    # Read side of a book file. probe() returns (x, y, value, kind, depth)
+    # for a known position, where value is from the point of view of the side
+    # to move (positive is good for it), or None.
+
+    def __init__(self, path, n, s, b_positions):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, book_n, book_s, self.slots, blocks_low, blocks_high) = HEADER.unpack_from(self.data, 0)
+        blocks = Board(n, s, b_positions).blocks
+        if magic != MAGIC or (book_n, book_s) != (n, s) or blocks_low | blocks_high << 64 != blocks:
+            self.close()
+            raise ValueError(F'{path} is not a book for n={n} s={s} blocks={b_positions}')
+        self.n = n
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, directory, n, s, b_positions):
+        if directory is None:
+            return None
+        path = book_filename(directory, n, s, b_positions)
+        if not os.path.exists(path):
+            return None
+        return cls(path, n, s, b_positions)
+
+    def probe(self, board, o_to_move):
+        (key, image) = board.canonical_key(o_to_move)
+        key = record_key(key)
+        mask = self.slots - 1
+        slot = key & mask
+        while True:
+            (stored, move, kind, depth, value) = RECORD.unpack_from(self.data, HEADER.size + slot * RECORD.size)
+            if stored == 0:
+                self.misses += 1
+                return None
+            if stored == key:
+                self.hits += 1
+                if move == NO_MOVE:
+                    return None, None, value, kind, depth
+                (x, y) = board.symmetry.from_image(image, divmod(move, self.n))
+                return x, y, value, kind, depth
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+        self.hits = 0
+        self.misses = 0
+
+
+# records maps a canonical key to (move, kind, depth, value). Entries already in
+# an existing file for the configuration are kept unless replaced.
+def write_book(path, n, s, b_positions, records):
+    if os.path.exists(path):
+        old = PositionBook(path, n, s, b_positions)
+        for slot in range(old.slots):
+            entry = RECORD.unpack_from(old.data, HEADER.size + slot * RECORD.size)
+            if entry[0] and entry[0] not in records:
+                records[entry[0]] = entry[1:]
+        old.close()
+    slots = 1
+    while slots < 2 * len(records):
+        slots *= 2
+    blocks = Board(n, s, b_positions).blocks
+    data = bytearray(HEADER.size + slots * RECORD.size)
+    HEADER.pack_into(data, 0, MAGIC, n, s, slots, blocks & (2 ** 64 - 1), blocks >> 64)
+    for key, (move, kind, depth, value) in records.items():
+        key = record_key(key)
+        slot = key & (slots - 1)
+        while RECORD.unpack_from(data, HEADER.size + slot * RECORD.size)[0]:
+            slot = (slot + 1) & (slots - 1)
+        value = max(-2 ** 31, min(2 ** 31 - 1, value))
+        RECORD.pack_into(data, HEADER.size + slot * RECORD.size, key, move, kind, depth, value)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    return len(records)
+
+
+# Perfect play over every position reachable from the empty board. A win
+# scores 1 + the number of empty cells left so that faster wins are better,
+# a loss the opposite, a tie 0; always from the side to move.
+def solve(n, s, b_positions):
+    board = Board(n, s, b_positions)
+    records = {}
+    sys.setrecursionlimit(max(1000, 4 * n * n))
+
+    def negamax(piece):
+        o_to_move = piece == 'O'
+        (key, image) = board.canonical_key(o_to_move)
+        if key in records:
+            return records[key][3]
+        best = None
+        best_move = None
+        other = 'X' if o_to_move else 'O'
+        for (x, y) in board.empty_cells():
+            board.place(x, y, piece)
+            status = board.status()
+            if status == piece:
+                value = 1 + board.empty_count
+            elif status == '.':
+                value = 0
+            else:
+                value = -negamax(other)
+            board.remove(x, y)
+            if best is None or value > best:
+                best = value
+                best_move = (x, y)
+        (x, y) = board.symmetry.to_image(image, best_move)
+        records[key] = (x * n + y, SOLVED, board.empty_count, best)
+        return best
+
+    negamax('X')
+    return records
+
+
+# Searches every position up to plies moves from the empty board with the
+# game's own alphabeta at the given depth and heuristic
+def openings(n, s, b_positions, plies, depth, e):
+    import io
+    from skeleton_tictactoe import Game
+    params = {'n': n, 's': s, 'b_positions': b_positions, 'd1': depth, 'd2': depth, 't': 10 ** 6,
+              'a1': True, 'a2': True, 'e1': e, 'e2': e, 'trace': io.StringIO()}
+    game = Game(recommend=False, params=params, book=None)
+    records = {}
+
+    def visit(ply):
+        o_to_move = game.player_turn == 'O'
+        (key, image) = game.board.canonical_key(o_to_move)
+        if key in records or game.is_end() is not None:
+            return
+        game.tt.clear()
+        game.stats.new_move()
+        (x, y, h_result) = game.search(game.ALPHABETA, max=o_to_move)
+        # The game's values are good for O when positive
+        value = h_result if o_to_move else -h_result
+        (x, y) = game.board.symmetry.to_image(image, (x, y))
+        records[key] = (x * n + y, OPENING, game.completed_depth, value)
+        if ply == plies:
+            return
+        for (i, j) in game.board.empty_cells():
+            game.board.place(i, j, game.player_turn)
+            game.switch_player()
+            visit(ply + 1)
+            game.switch_player()
+            game.board.remove(i, j)
+
+    visit(0)
+    return records
+
+
+def parse_blocks(value):
+    # "0,0 1,2" or [[0, 0], [1, 2]]
+    if isinstance(value, str):
+        return [tuple(int(c) for c in cell.split(',')) for cell in value.split()]
+    return [tuple(cell) for cell in value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the on-disk position book of a configuration.')
+    parser.add_argument('mode', choices=('solve', 'openings'), help='solve the whole game or search the openings')
+    parser.add_argument('--n', type=int, required=True)
+    parser.add_argument('--s', type=int, required=True)
+    parser.add_argument('--blocks', default='', help='block positions such as "0,0 3,3"')
+    parser.add_argument('--plies', type=int, default=2, help='openings: moves from the empty board (default 2)')
+    parser.add_argument('--depth', type=int, default=4, help='openings: search depth (default 4)')
+    parser.add_argument('--e', type=int, default=2, help='openings: heuristic (default 2)')
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY, help='where the books are (default books)')
+    args = parser.parse_args()
+
+    b_positions = parse_blocks(args.blocks)
+    if args.mode == 'solve':
+        records = solve(args.n, args.s, b_positions)
+    else:
+        records = openings(args.n, args.s, b_positions, args.plies, args.depth, args.e)
+    path = book_filename(args.directory, args.n, args.s, b_positions)
+    total = write_book(path, args.n, args.s, b_positions, records)
+    print(F'{path}: {total} positions')
+
+
+if __name__ == "__main__":
+    main()
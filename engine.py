@@ -0,0 +1,491 @@
+import itertools
+import sys
+import time
+
+from ordering import TT_MOVE, KILLERS
+from stats import IS_END, MOVE_GENERATION
+from transposition import EXACT, LOWER, UPPER
+
+# Nodes searched between two looks at the clock
+CLOCK_INTERVAL = 64
+# Value paired with every move of the nodes that search all their children
+NO_VALUES = itertools.repeat(None)
+
+
+class SearchEngine:
+    # The recursive searches behind Game.minimax, Game.alphabeta and
+    # Game.negascout. Everything a node needs is an attribute of this small
+    # slotted object, set by prepare() before every search, so the recursion
+    # doesn't go through the Game object. Nodes only return their value, the
+    # best move is kept for the root in best_move. Nodes and evaluations are
+    # counted per ply in plain lists and added to the SearchStats of the game
+    # by flush_stats() at the end of the search. Moves are generated lazily,
+    # see generate(), into one reused buffer per ply. Frontier nodes score
+    # their children with one batched heuristic call, see frontier().
+
+    __slots__ = ('board', 'tt', 'stats', 'timing', 'ordering', 'clock', 'symmetry', 'evaluate', 'heuristic',
+                 'evaluate_children', 'batch', 'threats', 'extension', 'near', 'neighbourhood', 'timed_out',
+                 'root_move', 'best_move', 'buffers', 'nodes', 'evaluations', 'cutoffs', 'timeouts', 'countdown')
+
+    def __init__(self):
+        self.timed_out = False
+        self.root_move = None
+        self.best_move = (None, None)
+        self.buffers = []
+        self.nodes = []
+        self.evaluations = []
+        self.cutoffs = 0
+        self.timeouts = 0
+        self.countdown = CLOCK_INTERVAL
+
+    # Takes the current state of game for a search of up to max_depth plies
+    # below the root
+    def prepare(self, game, max_depth):
+        self.board = game.board
+        self.tt = game.tt
+        self.stats = game.stats
+        self.timing = game.stats.timing
+        self.ordering = game.ordering
+        self.clock = game.clock
+        self.symmetry = game.board.symmetry
+        self.threats = game.threats
+        self.extension = game.extension if game.threats else 0
+        self.near = game.s - 1
+        self.neighbourhood = game.neighbourhood
+        # The running scores of the board are read directly unless they have
+        # to be checked or aren't kept
+        heuristic = game.e1 if game.player_turn == 'X' else game.e2
+        self.heuristic = 0
+        self.evaluate = game.call_heuristic
+        self.evaluate_children = game.call_heuristic_children
+        self.batch = game.batch
+        if game.incremental and not game.debug and not self.timing:
+            self.heuristic = heuristic
+        plies = max_depth + self.extension + 2
+        while len(self.buffers) < plies:
+            self.buffers.append([])
+        self.nodes = [0] * plies
+        self.evaluations = [0] * plies
+        self.cutoffs = 0
+        self.timeouts = 0
+        self.best_move = (None, None)
+
+    def flush_stats(self):
+        stats = self.stats
+        if not stats.enabled:
+            return
+        for ply, count in enumerate(self.nodes):
+            if count:
+                stats.nodes[ply] = stats.nodes.get(ply, 0) + count
+                stats.node_count += count
+                if ply > stats.max_depth:
+                    stats.max_depth = ply
+        for ply, count in enumerate(self.evaluations):
+            if count:
+                stats.evaluations[ply] = stats.evaluations.get(ply, 0) + count
+        stats.cutoffs += self.cutoffs
+        stats.timeouts += self.timeouts
+
+    def leaf(self, count):
+        self.evaluations[count] += 1
+        heuristic = self.heuristic
+        if heuristic == 1:
+            return self.board.material
+        if heuristic == 2:
+            return self.board.e2_score
+        return self.evaluate()
+
+    # Moves of a node whose children are at the depth limit, for piece,
+    # paired with the values for O of the children scored by one batched
+    # heuristic call, or None for the ones to search. Children left in a
+    # forcing position are followed further (see forcing). With best, the
+    # first move (the transposition table or killer move) is searched as
+    # usual since it often cuts off alone. Only when it didn't are the others
+    # scored, and only the best of them is kept: no other can count for the
+    # node.
+    def frontier(self, moves, piece, count, max_depth, best):
+        if best:
+            moves = iter(moves)
+            first = next(moves, None)
+            if first is None:
+                return
+            yield first, None
+        moves = list(moves)
+        if not moves:
+            return
+        values = self.evaluate_children(moves, piece)
+        if self.extension and count + 1 < max_depth + self.extension:
+            threats = self.board.child_threats(moves, piece)
+        else:
+            threats = [False] * len(moves)
+        self.evaluations[count + 1] += threats.count(False)
+        if not best:
+            for index, move in enumerate(moves):
+                yield move, None if threats[index] else values[index]
+            return
+        top = None
+        for index, move in enumerate(moves):
+            if threats[index]:
+                yield move, None
+            elif top is None or (values[index] > values[top] if piece == 'O' else values[index] < values[top]):
+                top = index
+        if top is not None:
+            yield moves[top], values[top]
+
+    # A child scored by frontier() counts as a node
+    def scored(self, value, count):
+        self.nodes[count] += 1
+        self.out_of_time()
+        return value
+
+    def status(self):
+        if self.timing:
+            started = time.perf_counter()
+            result = self.board.status()
+            self.stats.add_time(IS_END, time.perf_counter() - started)
+            return result
+        return self.board.status()
+
+    # True once the time is up, the clock itself is only read every
+    # CLOCK_INTERVAL nodes
+    def out_of_time(self):
+        if self.timed_out:
+            return True
+        self.countdown -= 1
+        if self.countdown > 0:
+            return False
+        self.countdown = CLOCK_INTERVAL
+        if self.clock.expired():
+            self.timeouts += 1
+            self.timed_out = True
+        return self.timed_out
+
+    # With threat detection on, the only moves worth searching for the side
+    # max in a forcing position: the winning cell if there is one, else the
+    # cells blocking the winning cells of the opponent, else a cell making a
+    # double threat. None when the position isn't forcing.
+    def forced_moves(self, max):
+        board = self.board
+        if max:
+            (piece, other) = ('O', 'X')
+        else:
+            (piece, other) = ('X', 'O')
+        cells = board.winning_cells(piece)
+        if cells:
+            return [board.coordinates(min(cells))]
+        cells = board.winning_cells(other)
+        if cells:
+            return [board.coordinates(idx) for idx in sorted(cells)]
+        cells = board.double_threats(piece)
+        if cells:
+            return [board.coordinates(min(cells))]
+        return None
+
+    # All the moves worth searching for the side max: the forced moves, else
+    # the empty cells near the stones (see Board.candidate_mask), without
+    # the ones leading to a position symmetric to another at the root
+    def candidate_moves(self, max, count):
+        board = self.board
+        if self.threats:
+            moves = self.forced_moves(max)
+            if moves is not None:
+                return moves
+        moves = board.mask_cells(board.candidate_mask(self.neighbourhood), self.buffers[count])
+        if count == 0:
+            moves = self.symmetry.unique_moves(moves, board.stabilizer())
+        return moves
+
+    # A node at the depth limit where a player can win on the next move is
+    # in the middle of a forcing sequence, which is followed a few more plies
+    # instead of being evaluated
+    def forcing(self, count, max_depth):
+        if count >= max_depth + self.extension:
+            return False
+        board = self.board
+        return bool(board.open_windows('X', self.near) or board.open_windows('O', self.near))
+
+    # Moves of a node below the root, generated lazily: forced moves come as
+    # a list, otherwise the candidate cells are yielded one by one from their
+    # bitmask, in stages when ordered: the transposition table move, the
+    # killer moves, then the rest sorted. A cutoff on an early move leaves
+    # the rest of the cells unlisted and unsorted. The root gets the full
+    # ordered list of candidate_moves.
+    def generate(self, max, count, tt_move=None, ordered=True):
+        if self.timing:
+            started = time.perf_counter()
+        ordering = self.ordering if ordered else None
+        moves = None
+        if self.threats:
+            moves = self.forced_moves(max)
+        if moves is None:
+            if count == 0:
+                moves = self.candidate_moves(max, count)
+                if ordering is not None:
+                    moves = ordering.order(moves, count, tt_move)
+            elif ordering is not None:
+                moves = self.staged(self.board.candidate_mask(self.neighbourhood), count, tt_move)
+            else:
+                moves = self.board.iter_cells(self.board.candidate_mask(self.neighbourhood))
+        elif ordering is not None and len(moves) > 1:
+            moves = ordering.order(moves, count, tt_move)
+        if self.timing:
+            self.stats.add_time(MOVE_GENERATION, time.perf_counter() - started)
+        return moves
+
+    def staged(self, mask, count, tt_move):
+        board = self.board
+        ordering = self.ordering
+        stages = ordering.stages
+        if TT_MOVE in stages and tt_move is not None and tt_move[0] is not None:
+            bit = 1 << board.index(tt_move[0], tt_move[1])
+            if mask & bit:
+                mask ^= bit
+                yield tt_move
+        if KILLERS in stages and count < len(ordering.killers):
+            for move in tuple(ordering.killers[count]):
+                bit = 1 << board.index(move[0], move[1])
+                if mask & bit:
+                    mask ^= bit
+                    yield move
+        if self.timing:
+            started = time.perf_counter()
+        rest = board.mask_cells(mask, self.buffers[count])
+        rest.sort(key=ordering.rank)
+        if self.timing:
+            self.stats.add_time(MOVE_GENERATION, time.perf_counter() - started)
+        yield from rest
+
+    def minimax(self, max, count, max_depth):
+        self.nodes[count] += 1
+        h_result = sys.maxsize
+        if max:
+            h_result = -sys.maxsize - 1
+        if self.status() is not None:
+            return self.leaf(count)
+        # The iteration is abandoned once the time is up, the driver throws
+        # away whatever it returns
+        if self.out_of_time():
+            return h_result
+        if count >= max_depth and not (self.extension and self.forcing(count, max_depth)):
+            return self.leaf(count)
+
+        board = self.board
+        # Entries are stored for the canonical image of the position, with
+        # the move in the frame of that image
+        (key, image) = board.canonical_key(max)
+        entry = self.tt.probe(key)
+        if entry is not None and entry[1] >= max_depth - count:
+            if count == 0:
+                self.best_move = self.symmetry.from_image(image, entry[4])
+            return entry[2]
+
+        x = None
+        y = None
+        moves = self.generate(max, count, ordered=False)
+        piece = 'O' if max else 'X'
+        if self.batch and count + 1 >= max_depth:
+            moves = self.frontier(moves, piece, count, max_depth, False)
+        else:
+            moves = zip(moves, NO_VALUES)
+        for ((i, j), value) in moves:
+            if value is not None:
+                h = self.scored(value, count + 1)
+            else:
+                board.place(i, j, piece)
+                h = self.minimax(not max, count + 1, max_depth)
+                board.remove(i, j)
+            if (max and h >= h_result) or (not max and h <= h_result):
+                h_result = h
+                x = i
+                y = j
+            if self.timed_out:
+                break
+
+        # Values found after the time ran out are only partial searches
+        if not self.timed_out:
+            self.tt.store(key, max_depth - count, h_result, EXACT, self.symmetry.to_image(image, (x, y)))
+        if count == 0:
+            self.best_move = (x, y)
+        return h_result
+
+    def alphabeta(self, alpha, beta, max, count, max_depth):
+        self.nodes[count] += 1
+        h_result = sys.maxsize
+        if max:
+            h_result = -sys.maxsize - 1
+        if self.status() is not None:
+            return self.leaf(count)
+        if self.out_of_time():
+            return h_result
+        if count >= max_depth and not (self.extension and self.forcing(count, max_depth)):
+            return self.leaf(count)
+
+        board = self.board
+        symmetry = self.symmetry
+        (key, image) = board.canonical_key(max)
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = symmetry.from_image(image, entry[4])
+            if entry[1] >= max_depth - count:
+                value = entry[2]
+                bound = entry[3]
+                if bound == EXACT:
+                    if count == 0:
+                        self.best_move = tt_move
+                    return value
+                elif bound == LOWER and value > alpha:
+                    alpha = value
+                elif bound == UPPER and value < beta:
+                    beta = value
+                if alpha >= beta:
+                    if count == 0:
+                        self.best_move = tt_move
+                    return value
+        if tt_move is None and count == 0:
+            # best move of the previous iteration
+            tt_move = self.root_move
+        alpha_start = alpha
+        beta_start = beta
+
+        x = None
+        y = None
+        moves = self.generate(max, count, tt_move)
+        piece = 'O' if max else 'X'
+        if self.batch and count + 1 >= max_depth:
+            moves = self.frontier(moves, piece, count, max_depth, True)
+        else:
+            moves = zip(moves, NO_VALUES)
+        for index, ((i, j), value) in enumerate(moves):
+            if value is not None:
+                h = self.scored(value, count + 1)
+            else:
+                board.place(i, j, piece)
+                h = self.alphabeta(alpha, beta, not max, count + 1, max_depth)
+                board.remove(i, j)
+            # Strictly better only: a child failing low can return a bound
+            # equal to the best value so far without being as good a move
+            if max:
+                if h > h_result:
+                    h_result = h
+                    x = i
+                    y = j
+            elif h < h_result:
+                h_result = h
+                x = i
+                y = j
+            if self.timed_out:
+                break
+            if (max and h_result >= beta) or (not max and h_result <= alpha):
+                self.cutoffs += 1
+                if self.ordering is not None:
+                    self.ordering.cutoff((i, j), count, max_depth - count, index)
+                break
+            if max:
+                if h_result > alpha:
+                    alpha = h_result
+            elif h_result < beta:
+                beta = h_result
+
+        if not self.timed_out:
+            if h_result <= alpha_start:
+                bound = UPPER
+            elif h_result >= beta_start:
+                bound = LOWER
+            else:
+                bound = EXACT
+            self.tt.store(key, max_depth - count, h_result, bound, symmetry.to_image(image, (x, y)))
+        if count == 0:
+            self.best_move = (x, y)
+        return h_result
+
+    # Principal variation search in negamax form: values are for the side to
+    # move (O is max), so the max and min branches are the same code. The
+    # first move gets the full window, the others a null window that only
+    # proves them worse, with a re-search when one turns out better.
+    # Transposition table entries are stored for O like the other searches.
+    def negascout(self, alpha, beta, max, count, max_depth):
+        self.nodes[count] += 1
+        color = 1 if max else -1
+        if self.status() is not None:
+            return color * self.leaf(count)
+        if self.out_of_time():
+            return -sys.maxsize
+        if count >= max_depth and not (self.extension and self.forcing(count, max_depth)):
+            return color * self.leaf(count)
+
+        board = self.board
+        symmetry = self.symmetry
+        (key, image) = board.canonical_key(max)
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = symmetry.from_image(image, entry[4])
+            if entry[1] >= max_depth - count:
+                value = color * entry[2]
+                bound = entry[3]
+                if bound != EXACT and not max:
+                    bound = UPPER if bound == LOWER else LOWER
+                if bound == EXACT:
+                    if count == 0:
+                        self.best_move = tt_move
+                    return value
+                elif bound == LOWER and value > alpha:
+                    alpha = value
+                elif bound == UPPER and value < beta:
+                    beta = value
+                if alpha >= beta:
+                    if count == 0:
+                        self.best_move = tt_move
+                    return value
+        if tt_move is None and count == 0:
+            tt_move = self.root_move
+        alpha_start = alpha
+
+        x = None
+        y = None
+        moves = self.generate(max, count, tt_move)
+        piece = 'O' if max else 'X'
+        h_result = -sys.maxsize
+        if self.batch and count + 1 >= max_depth:
+            moves = self.frontier(moves, piece, count, max_depth, True)
+        else:
+            moves = zip(moves, NO_VALUES)
+        for index, ((i, j), value) in enumerate(moves):
+            if value is not None:
+                # An exact value, no null window to try
+                h = color * self.scored(value, count + 1)
+            else:
+                board.place(i, j, piece)
+                if index == 0:
+                    h = -self.negascout(-beta, -alpha, not max, count + 1, max_depth)
+                else:
+                    h = -self.negascout(-alpha - 1, -alpha, not max, count + 1, max_depth)
+                    if alpha < h < beta and not self.timed_out:
+                        h = -self.negascout(-beta, -h, not max, count + 1, max_depth)
+                board.remove(i, j)
+            if self.timed_out:
+                break
+            if h > h_result:
+                h_result = h
+                x = i
+                y = j
+            if h_result > alpha:
+                alpha = h_result
+            if alpha >= beta:
+                self.cutoffs += 1
+                if self.ordering is not None:
+                    self.ordering.cutoff((i, j), count, max_depth - count, index)
+                break
+
+        if not self.timed_out:
+            if h_result <= alpha_start:
+                bound = UPPER if max else LOWER
+            elif h_result >= beta:
+                bound = LOWER if max else UPPER
+            else:
+                bound = EXACT
+            self.tt.store(key, max_depth - count, color * h_result, bound, symmetry.to_image(image, (x, y)))
+        if count == 0:
+            self.best_move = (x, y)
+        return h_result
@@ -0,0 +1,151 @@
+import json
+import os
+import platform
+
+from lines import LineIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Below this many windows to score (windows x boards) the per-call overhead of
+# NumPy costs more than the plain Python loop. Under PyPy the Python loop is
+# always faster.
+NUMPY_MIN_WINDOWS = 256
+USE_NUMPY = numpy is not None and platform.python_implementation() != 'PyPy'
+
+# Where selfplay.py saves tuned weights and Game looks for them
+DEFAULT_WEIGHTS_DIRECTORY = 'weights'
+
+_evaluators = {}
+
+
+def weights_filename(directory, n, s):
+    return os.path.join(directory, F'weights-{n}-{s}.json')
+
+
+# Tuned e2 weights of the (n, s) configurations, None if there are none
+def load_weights(directory, n, s):
+    if directory is None:
+        return None
+    path = weights_filename(directory, n, s)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    weights = [int(w) for w in data['weights']]
+    if (data['n'], data['s']) != (n, s) or len(weights) != s + 1:
+        raise ValueError(F'{path} does not hold weights for n={n} s={s}')
+    return weights
+
+
+class LineEvaluator:
+    # Line scoring for heuristic e2 over the windows of the LineIndex of the
+    # configuration. A window holding k X and no O scores +weights[k], one
+    # holding k O and no X scores -weights[k], a window holding both scores
+    # nothing. The weights are 10^k unless tuned ones are given, those are
+    # fitted for O, the maximising player, and are negative (see selfplay.py).
+
+    def __init__(self, n, s, b_positions=(), weights=None):
+        self.n = n
+        self.s = s
+        self.stride = n + 1
+        self.lines = LineIndex.get(n, s, b_positions)
+        self.windows = self.lines.windows
+        self.masks = self.lines.masks
+        if weights is None:
+            weights = [0] + [10 ** k for k in range(1, s + 1)]
+        self.weights = list(weights)
+
+        self.use_numpy = USE_NUMPY and len(self.windows) > 0
+        if self.use_numpy:
+            self.nbytes = (n * self.stride + 7) // 8
+            self.window_array = numpy.array(self.windows, dtype=numpy.intp).reshape(-1, s)
+            self.weight_array = numpy.array(self.weights, dtype=numpy.int64)
+
+    @classmethod
+    def get(cls, n, s, b_positions=(), weights=None):
+        key = (n, s, frozenset(b_positions), tuple(weights) if weights is not None else None)
+        if key not in _evaluators:
+            _evaluators[key] = cls(n, s, b_positions, weights)
+        return _evaluators[key]
+
+    def score(self, board):
+        if self.use_numpy and len(self.windows) >= NUMPY_MIN_WINDOWS:
+            cells = numpy.stack([self.unpack(board.x), self.unpack(board.o)])
+            return int(self.score_array(cells[None])[0])
+        return self.score_masks(board.x, board.o)
+
+    # Scores every child of board reached by placing piece on one of moves,
+    # in the order of moves
+    def score_children(self, board, moves, piece):
+        if not moves:
+            return []
+        if self.use_numpy and len(moves) * len(self.windows) >= NUMPY_MIN_WINDOWS:
+            cells = numpy.stack([self.unpack(board.x), self.unpack(board.o)])
+            batch = numpy.repeat(cells[None], len(moves), axis=0)
+            rows = numpy.arange(len(moves))
+            idx = numpy.array([x * self.stride + y for (x, y) in moves], dtype=numpy.intp)
+            if piece == 'X':
+                batch[rows, 0, idx] = 1
+            else:
+                batch[rows, 1, idx] = 1
+            return [int(value) for value in self.score_array(batch)]
+        scores = []
+        for (x, y) in moves:
+            bit = 1 << (x * self.stride + y)
+            if piece == 'X':
+                scores.append(self.score_masks(board.x | bit, board.o))
+            else:
+                scores.append(self.score_masks(board.x, board.o | bit))
+        return scores
+
+    def unpack(self, bits):
+        raw = numpy.frombuffer(bits.to_bytes(self.nbytes, 'little'), dtype=numpy.uint8)
+        return numpy.unpackbits(raw, bitorder='little')
+
+    # batch has shape (boards, 2, cells) with the X bits then the O bits
+    def score_array(self, batch):
+        counts = batch[:, :, self.window_array].sum(axis=3)
+        count_x = counts[:, 0]
+        count_o = counts[:, 1]
+        total = numpy.where(count_o == 0, self.weight_array[count_x], 0).sum(axis=1)
+        total -= numpy.where(count_x == 0, self.weight_array[count_o], 0).sum(axis=1)
+        return total
+
+    def score_masks(self, x, o):
+        total = 0
+        weights = self.weights
+        for mask in self.masks:
+            in_x = x & mask
+            in_o = o & mask
+            if in_x and not in_o:
+                total += weights[bin(in_x).count('1')]
+            elif in_o and not in_x:
+                total -= weights[bin(in_o).count('1')]
+        return total
+
+    # e2 as a sum over k of weights[k] * features[k]: the number of windows
+    # holding k X and no O less the number holding k O and no X
+    def features(self, x, o):
+        features = [0] * (self.s + 1)
+        for mask in self.masks:
+            in_x = x & mask
+            in_o = o & mask
+            if in_x and not in_o:
+                features[bin(in_x).count('1')] += 1
+            elif in_o and not in_x:
+                features[bin(in_o).count('1')] -= 1
+        return features
+
+    # features of many boards at once, batch as for score_array
+    def feature_array(self, batch):
+        counts = batch[:, :, self.window_array].sum(axis=3)
+        count_x = counts[:, 0]
+        count_o = counts[:, 1]
+        features = numpy.zeros((len(batch), self.s + 1), dtype=numpy.int64)
+        for k in range(1, self.s + 1):
+            features[:, k] = ((count_x == k) & (count_o == 0)).sum(axis=1)
+            features[:, k] -= ((count_o == k) & (count_x == 0)).sum(axis=1)
+        return features
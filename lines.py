@@ -0,0 +1,45 @@
+_indexes = {}
+
+
+class LineIndex:
+    # Every length-s window of a row, column or diagonal of the board, built
+    # once per (n, s, blocks) configuration. Cells are board bit indices
+    # (x * (n + 1) + y, see Board). A window holding a block can never be
+    # won, so it is dropped. cell_windows maps each cell to the ids of the
+    # windows through it, cell_masks to the bitmasks of the same windows.
+
+    def __init__(self, n, s, b_positions=()):
+        self.n = n
+        self.s = s
+        self.stride = n + 1
+        blocks = set(x * self.stride + y for (x, y) in b_positions)
+        self.windows = []
+        for (dx, dy) in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for x in range(n):
+                for y in range(n):
+                    end_x = x + (s - 1) * dx
+                    end_y = y + (s - 1) * dy
+                    if not (0 <= end_x < n and 0 <= end_y < n):
+                        continue
+                    window = tuple((x + k * dx) * self.stride + y + k * dy for k in range(s))
+                    if not blocks.intersection(window):
+                        self.windows.append(window)
+        self.masks = [sum(1 << idx for idx in window) for window in self.windows]
+
+        self.cell_windows = [[] for _ in range(n * self.stride)]
+        for w, window in enumerate(self.windows):
+            for idx in window:
+                self.cell_windows[idx].append(w)
+        self.cell_masks = [[self.masks[w] for w in windows] for windows in self.cell_windows]
+
+    @classmethod
+    def get(cls, n, s, b_positions=()):
+        key = (n, s, frozenset(b_positions))
+        if key not in _indexes:
+            _indexes[key] = cls(n, s, b_positions)
+        return _indexes[key]
+
+    # Number of windows through cell (x, y), 0 means the cell can't be part
+    # of any winning line
+    def potential(self, x, y):
+        return len(self.cell_windows[x * self.stride + y])
@@ -0,0 +1,202 @@
+import math
+import random
+import time
+
+from board import Board
+
+EXPLORATION = 1.4
+# Playout policies
+RANDOM = 'random'
+GUIDED = 'guided'
+
+
+def other_piece(piece):
+    return 'O' if piece == 'X' else 'X'
+
+
+class Node:
+    # piece made move to reach the node, wins counts the playouts through the
+    # node won by piece (a tie counts half)
+    __slots__ = ('move', 'parent', 'piece', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, parent, piece, untried):
+        self.move = move
+        self.parent = parent
+        self.piece = piece
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+
+
+class MCTS:
+    # Monte Carlo tree search with UCT selection on a board of its own. Every
+    # playout walks down the tree through the child with the best upper
+    # confidence bound, adds one node and plays the game out from there:
+    # at random, or GUIDED where winning and blocking moves are always played
+    # and the other moves are drawn next to the stones. The result counts in
+    # every node of the path for the player who moved into it. The tree is
+    # kept between moves and reused when the position after the moves played
+    # since the last search is in it.
+
+    def __init__(self, n, s, b_positions=(), rollout=GUIDED, exploration=EXPLORATION, neighbourhood=2,
+                 seed=None):
+        if rollout not in (RANDOM, GUIDED):
+            raise ValueError(F'Unknown playout policy: {rollout}')
+        self.n = n
+        self.s = s
+        self.b_positions = b_positions
+        self.rollout_policy = rollout
+        self.exploration = exploration
+        self.neighbourhood = neighbourhood
+        self.rng = random.Random(seed)
+        # Window counts are only needed to spot wins and blocks in playouts
+        self.board = Board(n, s, b_positions, incremental=rollout == GUIDED, symmetric=False)
+        self.root = None
+        self.playouts = 0
+        self.depth = 0
+
+    # Moves of a new node with piece to move: the winning cell, else the
+    # cells blocking the opponent, else the cells near the stones
+    def moves(self, piece):
+        board = self.board
+        if board.status() is not None:
+            return []
+        wins = board.winning_cells(piece)
+        if wins:
+            return [board.coordinates(min(wins))]
+        blocks = board.winning_cells(other_piece(piece))
+        if blocks:
+            return [board.coordinates(idx) for idx in sorted(blocks)]
+        moves = board.mask_cells(board.candidate_mask(self.neighbourhood))
+        self.rng.shuffle(moves)
+        return moves
+
+    # Brings the board of the tree to the position of board with piece to
+    # move. The tree is kept when at most one move of each player was made
+    # since the last search and they are in the tree.
+    def sync(self, board, piece):
+        mine = self.board
+        node = self.root
+        added_x = board.x & ~mine.x
+        added_o = board.o & ~mine.o
+        if node is not None and not (mine.x & ~board.x or mine.o & ~board.o) \
+                and bin(added_x).count('1') <= 1 and bin(added_o).count('1') <= 1:
+            side = other_piece(node.piece)
+            for _ in range(bin(added_x | added_o).count('1')):
+                added = added_x if side == 'X' else added_o
+                if not added or node is None:
+                    node = None
+                    break
+                move = mine.coordinates(added.bit_length() - 1)
+                mine.place(move[0], move[1], side)
+                node = next((child for child in node.children if child.move == move), None)
+                side = other_piece(side)
+            if node is not None and other_piece(node.piece) == piece:
+                node.parent = None
+                self.root = node
+                return
+        self.board = mine = Board(self.n, self.s, self.b_positions, incremental=self.rollout_policy == GUIDED,
+                                  symmetric=False)
+        for (x, y) in board.mask_cells(board.x):
+            mine.place(x, y, 'X')
+        for (x, y) in board.mask_cells(board.o):
+            mine.place(x, y, 'O')
+        self.root = Node(None, None, other_piece(piece), self.moves(piece))
+
+    # Playouts from the position of board with piece to move until the
+    # deadline of clock, the last one started when one more of the average
+    # length still ends in time. Returns (move, visits, wins) of every child
+    # of the root.
+    def search(self, board, piece, clock, stats):
+        self.sync(board, piece)
+        self.playouts = 0
+        self.depth = 0
+        start = time.time()
+        while True:
+            self.playout(stats)
+            self.playouts += 1
+            now = time.time()
+            if now + (now - start) / self.playouts >= clock.deadline:
+                break
+        return [(child.move, child.visits, child.wins) for child in self.root.children]
+
+    def select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        best = None
+        best_bound = -1.0
+        for child in node.children:
+            bound = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if bound > best_bound:
+                best = child
+                best_bound = bound
+        return best
+
+    def playout(self, stats):
+        board = self.board
+        node = self.root
+        placed = []
+        depth = 0
+        while not node.untried and node.children:
+            node = self.select(node)
+            board.place(node.move[0], node.move[1], node.piece)
+            placed.append(node.move)
+            depth += 1
+            stats.node(depth)
+        if node.untried:
+            move = node.untried.pop()
+            piece = other_piece(node.piece)
+            board.place(move[0], move[1], piece)
+            placed.append(move)
+            child = Node(move, node, piece, self.moves(other_piece(piece)))
+            node.children.append(child)
+            node = child
+            depth += 1
+            stats.node(depth)
+        if depth > self.depth:
+            self.depth = depth
+
+        result = self.rollout(other_piece(node.piece))
+        stats.evaluation(depth)
+        while node is not None:
+            node.visits += 1
+            if result == node.piece:
+                node.wins += 1
+            elif result == '.':
+                node.wins += 0.5
+            node = node.parent
+        for (x, y) in reversed(placed):
+            board.remove(x, y)
+
+    # Plays the game out with piece to move, returns the winner or '.' and
+    # leaves the board as it was
+    def rollout(self, piece):
+        board = self.board
+        rng = self.rng
+        placed = []
+        result = board.status()
+        if self.rollout_policy == RANDOM:
+            cells = board.empty_cells()
+            rng.shuffle(cells)
+            for (x, y) in cells:
+                if result is not None:
+                    break
+                board.place(x, y, piece)
+                placed.append((x, y))
+                result = board.status()
+                piece = other_piece(piece)
+        else:
+            while result is None:
+                cells = board.winning_cells(piece) or board.winning_cells(other_piece(piece))
+                if cells:
+                    move = board.coordinates(min(cells))
+                else:
+                    move = rng.choice(board.mask_cells(board.candidate_mask(1)))
+                board.place(move[0], move[1], piece)
+                placed.append(move)
+                result = board.status()
+                piece = other_piece(piece)
+        for (x, y) in reversed(placed):
+            board.remove(x, y)
+        return result
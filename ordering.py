@@ -0,0 +1,85 @@
+# Move ordering stages, in the order they are tried
+TT_MOVE = 'tt'
+KILLERS = 'killers'
+HISTORY = 'history'
+LINES = 'lines'
+CENTRE = 'centre'
+
+DEFAULT_STAGES = (TT_MOVE, KILLERS, HISTORY, LINES, CENTRE)
+
+
+class MoveOrdering:
+    # Orders the moves of an alphabeta node so that the move most likely to
+    # cause a cutoff is searched first: the transposition table / previous
+    # iteration best move, then the killer moves of the ply, then the rest
+    # ranked by the history table, by the number of winnable lines through
+    # them and by how close they are to the centre. Stages can be left out to
+    # measure what each one brings.
+
+    def __init__(self, n, lines=None, stages=DEFAULT_STAGES, killers_per_ply=2):
+        self.n = n
+        self.lines = lines
+        self.stages = stages
+        self.killers_per_ply = killers_per_ply
+        self.killers = []
+        self.history = {}
+        # Manhattan distance to the centre of the board, smaller is better
+        c = (n - 1) / 2
+        self.centre = {(i, j): abs(i - c) + abs(j - c) for i in range(n) for j in range(n)}
+        # The line and centre stages never change during a game, their part
+        # of the sort key is computed once per cell
+        self.use_history = HISTORY in stages
+        self.static_rank = {}
+        for move in self.centre:
+            key = []
+            if LINES in stages and lines is not None:
+                key.append(-lines.potential(move[0], move[1]))
+            if CENTRE in stages:
+                key.append(self.centre[move])
+            self.static_rank[move] = tuple(key)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        self.killers = []
+        # Old history is still a good hint, but recent cutoffs should win
+        for move in self.history:
+            self.history[move] //= 2
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, moves, ply, tt_move=None):
+        first = []
+        if TT_MOVE in self.stages and tt_move is not None and tt_move in moves:
+            first.append(tt_move)
+        if KILLERS in self.stages and ply < len(self.killers):
+            for move in self.killers[ply]:
+                if move not in first and move in moves:
+                    first.append(move)
+        rest = [move for move in moves if move not in first]
+        rest.sort(key=self.rank)
+        return first + rest
+
+    def rank(self, move):
+        if self.use_history:
+            return (-self.history.get(move, 0),) + self.static_rank[move]
+        return self.static_rank[move]
+
+    # Called when the move at position index of the node caused a cutoff with
+    # depth plies left to search below the node
+    def cutoff(self, move, ply, depth, index):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.killers_per_ply:]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+    def first_move_ratio(self):
+        if self.cutoffs == 0:
+            return 0
+        return self.first_move_cutoffs / self.cutoffs
@@ -0,0 +1,64 @@
+import json
+import queue
+import threading
+
+
+class TraceWriter:
+    # File-like buffer in front of a trace file. write() only appends to a
+    # list, the text is handed over to a background thread doing the file
+    # I/O when flush() is called (at the end of every game) or when more than
+    # limit characters are waiting, so the game loop never waits on the disk.
+    # close() writes what is left, waits for the thread and closes the file
+    # if it was opened for the writer (owns).
+
+    def __init__(self, file, owns=True, background=True, limit=1 << 16):
+        self.file = file
+        self.owns = owns
+        self.limit = limit
+        self.buffer = []
+        self.size = 0
+        self.queue = None
+        self.thread = None
+        if background:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+
+    # Structured trace: one JSON object per line, its kind under "record"
+    def record(self, kind, **fields):
+        self.write(json.dumps(dict(record=kind, **fields)) + '\n')
+
+    def flush(self):
+        if not self.buffer:
+            return
+        text = ''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        if self.queue is None:
+            self.file.write(text)
+            self.file.flush()
+        else:
+            self.queue.put(text)
+
+    def run(self):
+        while True:
+            text = self.queue.get()
+            if text is None:
+                return
+            self.file.write(text)
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+        if self.owns:
+            self.file.close()
@@ -0,0 +1,105 @@
+import multiprocessing
+
+from mcts import MCTS
+from transposition import TranspositionTable
+
+# Set in every worker process by init_worker
+_shared_bound = None
+# One transposition table per searching player, kept between tasks
+_tables = {}
+# One MCTS tree per searching player and worker number, kept between tasks
+_trees = {}
+# Seconds an MCTS worker stops before the deadline of the move, left for
+# sending its root statistics back and merging them
+RESULT_MARGIN = 0.05
+
+
+def create_pool(workers):
+    # The best root value found so far is shared by all workers so that a
+    # good move found by one worker narrows the window of the others
+    shared_bound = multiprocessing.Value('d', 0.0)
+    pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(shared_bound,))
+    return pool, shared_bound
+
+
+def init_worker(shared_bound):
+    global _shared_bound
+    _shared_bound = shared_bound
+
+
+def worker_table(game):
+    key = (game.player_turn, game.tt_size, game.tt_policy)
+    if key not in _tables:
+        _tables[key] = TranspositionTable(game.tt_size, game.tt_policy)
+    table = _tables[key]
+    table.new_search(game.stones())
+    return table
+
+
+# Searches a share of the root moves of game at the given depth. The game is
+# a copy sent by the parent process, its clock carries the deadline of the
+# move. Returns the best move of the share with the statistics of the search.
+def search_root_moves(task):
+    (game, algo, max, depth, alpha, beta, moves) = task
+    game.tt = worker_table(game)
+    game.stats.new_move()
+    game.timed_out = False
+    if game.ordering is not None:
+        game.ordering.cutoffs = 0
+        game.ordering.first_move_cutoffs = 0
+
+    x = None
+    y = None
+    h_result = None
+    for (i, j) in moves:
+        shared = _shared_bound.value
+        if max:
+            if shared > alpha:
+                alpha = shared
+            game.board.place(i, j, 'O')
+        else:
+            if shared < beta:
+                beta = shared
+            game.board.place(i, j, 'X')
+        h = game.search_child(algo, max, alpha, beta, depth)
+        game.board.remove(i, j)
+        if game.timed_out:
+            break
+        if h_result is None or (max and h > h_result) or (not max and h < h_result):
+            h_result = h
+            x = i
+            y = j
+            with _shared_bound.get_lock():
+                if (max and h > _shared_bound.value) or (not max and h < _shared_bound.value):
+                    _shared_bound.value = h
+
+    result = {
+        'move': (x, y),
+        'value': h_result,
+        'timed_out': game.timed_out,
+        'stats': game.stats,
+        'tt': (game.tt.hits, game.tt.misses, game.tt.collisions),
+        'cutoffs': (0, 0),
+    }
+    if game.ordering is not None:
+        result['cutoffs'] = (game.ordering.cutoffs, game.ordering.first_move_cutoffs)
+    return result
+
+
+# Root-parallel MCTS: every worker grows a tree of its own from the position
+# of game until RESULT_MARGIN before the deadline of its clock. Returns the
+# visits and wins of the root moves of the tree.
+def mcts_playouts(task):
+    (game, piece, number) = task
+    key = (piece, number, game.n, game.s, tuple(game.b_positions), game.rollout)
+    if key not in _trees:
+        _trees[key] = MCTS(game.n, game.s, game.b_positions, game.rollout, neighbourhood=game.neighbourhood)
+    tree = _trees[key]
+    game.stats.new_move()
+    game.clock.deadline -= RESULT_MARGIN
+    children = tree.search(game.board, piece, game.clock, game.stats)
+    return {
+        'children': children,
+        'depth': tree.depth,
+        'stats': game.stats,
+    }
@@ -0,0 +1,72 @@
+import copy
+import threading
+
+from mcts import other_piece
+
+# Seconds a ponder search may run, it is normally stopped long before
+PONDER_LIMIT = 3600
+
+
+class Ponderer:
+    # Searches for the AI player in a background thread while the human
+    # opponent types a move. Alphabeta, PVS and minimax players search the
+    # position after the predicted reply into their own transposition table,
+    # so when the prediction hits, the iterations finished while pondering
+    # come straight out of the table in the real search. MCTS players grow
+    # their tree from the current position, every reply of the human is in
+    # it and the tree is reused whatever the reply. The thread works on a
+    # copy of the game, only the table or the tree are shared, and nothing
+    # else searches while the human is thinking.
+
+    def __init__(self):
+        self.game = None
+        self.thread = None
+        self.move = None
+        self.depth = 0
+
+    # piece is the AI player searching with algo, move the predicted reply
+    # of the human
+    def start(self, game, piece, algo, move):
+        ponder = copy.deepcopy(game)
+        ponder.tt = game.tables[piece]
+        ponder.trees = game.trees
+        ponder.book = game.book
+        ponder.workers = 1
+        ponder.player_turn = piece
+        ponder.t = PONDER_LIMIT
+        self.game = ponder
+        self.depth = 0
+        if algo == game.MCTS:
+            self.move = None
+            self.thread = threading.Thread(target=self.run_mcts, args=(other_piece(piece),), daemon=True)
+        else:
+            self.move = tuple(move)
+            ponder.board.place(move[0], move[1], other_piece(piece))
+            ponder.tt.new_search(ponder.stones())
+            self.thread = threading.Thread(target=self.run, args=(algo, piece == 'O'), daemon=True)
+        self.thread.start()
+
+    def run(self, algo, max):
+        self.game.search(algo, max)
+        self.depth = self.game.completed_depth
+
+    def run_mcts(self, piece):
+        game = self.game
+        tree = game.mcts_tree(other_piece(piece))
+        game.clock.start(game.t)
+        tree.search(game.board, piece, game.clock, game.stats)
+        self.depth = tree.depth
+
+    # Stops the search, the deadline is moved until the thread has seen it
+    # as the search sets its own when it starts
+    def stop(self):
+        if self.thread is None:
+            return
+        while self.thread.is_alive():
+            self.game.clock.deadline = 0.0
+            self.thread.join(0.01)
+        self.thread = None
+
+    # True when the search was made for the position after move
+    def hit(self, move):
+        return self.move is None or self.move == tuple(move)
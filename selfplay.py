@@ -0,0 +1,339 @@
+#!/usr/bin/env pypy
+# Self-play data and e2 weight tuning. generate plays AI vs AI games of one
+# (n, s, blocks) configuration in worker processes and appends every position
+# reached, with the result of its game, to the dataset file of the
+# configuration as the games finish. tune fits the weights of the e2 line
+# heuristic to the datasets: e2 is a sum of weights[k] times the number of
+# windows holding k stones of one player only (see LineEvaluator.features),
+# the fit makes it predict whether O wins, by logistic regression or SPSA on
+# the same loss. O is the maximising player of the search, so the fitted
+# weights come out negative: a window of O stones raises the score. The
+# weights are saved where Game loads them from.
+#
+#   pypy selfplay.py generate --n 7 --s 4 --games 200 --workers 4 --depth 2
+#   pypy selfplay.py tune --n 7 --s 4 --method logistic
+#
+# A dataset file is a header followed by fixed-size records:
+# the X and O bitmasks of the position (see Board), the number of moves
+# played and the result of the game (1 X won, -1 O won, 0 tie).
+import argparse
+import glob
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import struct
+
+from board import Board
+from book import parse_blocks
+from evaluation import LineEvaluator, DEFAULT_WEIGHTS_DIRECTORY, weights_filename, numpy
+
+MAGIC = b'TTTPLAY1'
+# magic, n, s, blocks bitmask (low and high 64 bits)
+HEADER = struct.Struct('<8sBBxxQQ')
+# X bits, O bits, moves played, result
+RECORD = struct.Struct('<16s16sBb')
+RESULTS = {'X': 1, 'O': -1, '.': 0}
+
+DEFAULT_DATA_DIRECTORY = 'data'
+LOGISTIC = 'logistic'
+SPSA = 'spsa'
+
+
+def dataset_filename(directory, n, s, b_positions):
+    blocks = Board(n, s, b_positions).blocks
+    return os.path.join(directory, F'selfplay-{n}-{s}-{blocks:x}.bin')
+
+
+# Appends the (x, o, ply, result) positions to the dataset at path, which is
+# created for the configuration if needed
+def write_positions(path, n, s, b_positions, positions):
+    blocks = Board(n, s, b_positions).blocks
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    new = not os.path.exists(path)
+    with open(path, 'ab') as f:
+        if new:
+            f.write(HEADER.pack(MAGIC, n, s, blocks & (2 ** 64 - 1), blocks >> 64))
+        for (x, o, ply, result) in positions:
+            f.write(RECORD.pack(x.to_bytes(16, 'little'), o.to_bytes(16, 'little'), ply, result))
+
+
+# Returns (n, s, b_positions, positions) of the dataset at path
+def read_positions(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    (magic, n, s, blocks_low, blocks_high) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(F'{path} is not a self-play dataset')
+    blocks = blocks_low | blocks_high << 64
+    stride = n + 1
+    b_positions = [divmod(idx, stride) for idx in range(n * stride) if blocks >> idx & 1]
+    positions = []
+    for (x, o, ply, result) in RECORD.iter_unpack(data[HEADER.size:]):
+        positions.append((int.from_bytes(x, 'little'), int.from_bytes(o, 'little'), ply, result))
+    return n, s, b_positions, positions
+
+
+# Plays one game in a worker process. The first random_plies moves and
+# every move with probability epsilon are random candidate moves so that
+# the games don't all look the same, the others are searched by alphabeta.
+def play_game(task):
+    from skeleton_tictactoe import Game
+    (params, seed, random_plies, epsilon, weights) = task
+    rng = random.Random(seed)
+    game = Game(recommend=False, quiet=True, book=None, ponder=False, weights=weights,
+                params=dict(params, trace=io.StringIO()))
+    board = game.board
+    positions = []
+    while game.is_end() is None:
+        max = game.player_turn == 'O'
+        x = None
+        if len(positions) >= random_plies and rng.random() >= epsilon:
+            game.tt = game.tables[game.player_turn]
+            game.tt.new_search(game.stones())
+            game.stats.new_move()
+            (x, y, h_result) = game.search(game.ALPHABETA, max)
+        if x is None:
+            (x, y) = rng.choice(game.candidate_moves(max))
+        board.place(x, y, game.player_turn)
+        game.switch_player()
+        positions.append((board.x, board.o, len(positions) + 1))
+    result = RESULTS[game.is_end()]
+    game.close_trace()
+    return [(x, o, ply, result) for (x, o, ply) in positions]
+
+
+def generate(n, s, b_positions, games, workers, depth, t, random_plies, epsilon, seed, weights, path):
+    if not 3 <= n <= 10 or not 3 <= s <= n:
+        raise ValueError(F'unsupported configuration n={n} s={s}')
+    occupied = set()
+    for (x, y) in b_positions:
+        if not (0 <= x < n and 0 <= y < n):
+            raise ValueError(F'block {x},{y} is off the board')
+        if (x, y) in occupied:
+            raise ValueError(F'block {x},{y} is given twice')
+        occupied.add((x, y))
+    if games < 1 or workers < 1 or depth < 1:
+        raise ValueError('games, workers and depth must be positive')
+    if t <= 0:
+        raise ValueError('t must be a positive number of seconds')
+    if random_plies < 0 or not 0 <= epsilon <= 1:
+        raise ValueError('random plies must be 0 or more and epsilon between 0 and 1')
+    params = {'n': n, 's': s, 'b_positions': b_positions, 'd1': depth, 'd2': depth, 't': t,
+              'a1': True, 'a2': True, 'e1': 2, 'e2': 2}
+    tasks = [(params, seed + k, random_plies, epsilon, weights) for k in range(games)]
+    pool = None
+    map_function = map
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        map_function = pool.imap_unordered
+    total = 0
+    results = {1: 0, -1: 0, 0: 0}
+    try:
+        for positions in map_function(play_game, tasks):
+            write_positions(path, n, s, b_positions, positions)
+            total += len(positions)
+            # A game over before the first move is a tie, no line could be won
+            results[positions[-1][3] if positions else 0] += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return total, results
+
+
+# Features (k = 1 .. s - 1) and targets (1 O won, 0 X won, 0.5 tie) of the
+# positions of a game still going on
+def training_set(n, s, b_positions, positions):
+    evaluator = LineEvaluator.get(n, s, b_positions)
+    if evaluator.use_numpy and positions:
+        batch = numpy.stack([numpy.stack([evaluator.unpack(x), evaluator.unpack(o)]) for (x, o, _, _) in positions])
+        features = evaluator.feature_array(batch).tolist()
+    else:
+        features = [evaluator.features(x, o) for (x, o, _, _) in positions]
+    rows = []
+    targets = []
+    for (f, (_, _, _, result)) in zip(features, positions):
+        if f[s]:
+            continue
+        rows.append(f[1:s])
+        targets.append((1 - result) / 2)
+    return rows, targets
+
+
+def sigmoid(z):
+    if z < -60:
+        return 0.0
+    if z > 60:
+        return 1.0
+    return 1 / (1 + math.exp(-z))
+
+
+# Mean logistic loss of the predictions sigmoid(w . f)
+def loss(w, rows, targets):
+    if numpy is not None:
+        p = 1 / (1 + numpy.exp(-numpy.clip(rows @ w, -60, 60)))
+        p = numpy.clip(p, 1e-12, 1 - 1e-12)
+        return float(-(targets * numpy.log(p) + (1 - targets) * numpy.log(1 - p)).mean())
+    total = 0.0
+    for (f, y) in zip(rows, targets):
+        p = min(max(sigmoid(sum(a * b for a, b in zip(w, f))), 1e-12), 1 - 1e-12)
+        total -= y * math.log(p) + (1 - y) * math.log(1 - p)
+    return total / len(rows)
+
+
+# Gradient descent on the logistic loss, features scaled by their spread
+def fit_logistic(rows, targets, iterations=2000, rate=0.5):
+    k = len(rows[0])
+    scale = [max(1.0, max(abs(f[i]) for f in rows)) for i in range(k)]
+    scaled = [[f[i] / scale[i] for i in range(k)] for f in rows]
+    w = [0.0] * k
+    if numpy is not None:
+        x = numpy.array(scaled)
+        y = numpy.array(targets)
+        w = numpy.zeros(k)
+        for _ in range(iterations):
+            p = 1 / (1 + numpy.exp(-numpy.clip(x @ w, -60, 60)))
+            w -= rate * (x.T @ (p - y)) / len(y)
+        w = w.tolist()
+    else:
+        for _ in range(iterations):
+            gradient = [0.0] * k
+            for (f, target) in zip(scaled, targets):
+                error = sigmoid(sum(a * b for a, b in zip(w, f))) - target
+                for i in range(k):
+                    gradient[i] += error * f[i]
+            w = [w[i] - rate * gradient[i] / len(scaled) for i in range(k)]
+    return [w[i] / scale[i] for i in range(k)]
+
+
+# Simultaneous perturbation stochastic approximation on the same loss: every
+# step moves all the weights at once from two loss evaluations
+def fit_spsa(rows, targets, iterations=2000, a=0.05, c=0.01, seed=0):
+    rng = random.Random(seed)
+    k = len(rows[0])
+    if numpy is not None:
+        rows = numpy.array(rows, dtype=float)
+        targets = numpy.array(targets)
+    w = [0.01] * k
+    for step in range(1, iterations + 1):
+        a_k = a / (step + 100) ** 0.602
+        c_k = c / step ** 0.101
+        delta = [rng.choice((-1, 1)) for _ in range(k)]
+        plus = [w[i] + c_k * delta[i] for i in range(k)]
+        minus = [w[i] - c_k * delta[i] for i in range(k)]
+        if numpy is not None:
+            difference = loss(numpy.array(plus), rows, targets) - loss(numpy.array(minus), rows, targets)
+        else:
+            difference = loss(plus, rows, targets) - loss(minus, rows, targets)
+        w = [w[i] - a_k * difference / (2 * c_k * delta[i]) for i in range(k)]
+    return w
+
+
+# Integer weights for the board: the fitted ones scaled so that the largest
+# in size is 10^(s - 1) like the default one of s - 1 stones, signs kept,
+# and -10^s for a completed line, which counts for O like the fitted ones
+def to_weights(w, s):
+    largest = max(abs(v) for v in w)
+    if not largest:
+        raise ValueError('The fit gives no weight to any window, there is nothing to save')
+    scale = 10 ** (s - 1) / largest
+    weights = [0] + [round(v * scale) for v in w]
+    weights.append(-10 ** s)
+    return weights
+
+
+# Share of the decisive positions where the sign of the score names the
+# winner, positive for O
+def agreement(weights, rows, targets):
+    right = 0
+    total = 0
+    for (f, y) in zip(rows, targets):
+        if y == 0.5:
+            continue
+        score = sum(weights[i + 1] * f[i] for i in range(len(f)))
+        total += 1
+        if (score > 0) == (y == 1):
+            right += 1
+    return right / total if total else 0.0
+
+
+def tune(n, s, paths, method, directory):
+    if not 3 <= n <= 10 or not 3 <= s <= n:
+        raise ValueError(F'unsupported configuration n={n} s={s}')
+    rows = []
+    targets = []
+    for path in paths:
+        (data_n, data_s, b_positions, positions) = read_positions(path)
+        if (data_n, data_s) != (n, s):
+            raise ValueError(F'{path} is not a dataset for n={n} s={s}')
+        (r, t) = training_set(n, s, b_positions, positions)
+        rows += r
+        targets += t
+    if not rows:
+        raise ValueError('No positions to tune on')
+    if method == LOGISTIC:
+        w = fit_logistic(rows, targets)
+    else:
+        w = fit_spsa(rows, targets)
+    weights = to_weights(w, s)
+    # The default weights turned to the side of the search
+    default = [0] + [-10 ** k for k in range(1, s + 1)]
+    if numpy is not None:
+        fitted_loss = loss(numpy.array(w), numpy.array(rows, dtype=float), numpy.array(targets))
+    else:
+        fitted_loss = loss(w, rows, targets)
+    path = weights_filename(directory, n, s)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'n': n, 's': s, 'weights': weights, 'method': method, 'positions': len(rows),
+                   'loss': fitted_loss}, f)
+        f.write('\n')
+    return path, weights, len(rows), fitted_loss, agreement(default, rows, targets), agreement(weights, rows, targets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate self-play games and tune the e2 weights on them.')
+    parser.add_argument('mode', choices=('generate', 'tune'), help='play games or fit the weights')
+    parser.add_argument('--n', type=int, required=True)
+    parser.add_argument('--s', type=int, required=True)
+    parser.add_argument('--blocks', default='', help='generate: block positions such as "0,0 3,3"')
+    parser.add_argument('--games', type=int, default=100, help='generate: games to play (default 100)')
+    parser.add_argument('--workers', type=int, default=1, help='generate: games played at the same time (default 1)')
+    parser.add_argument('--depth', type=int, default=2, help='generate: search depth (default 2)')
+    parser.add_argument('--t', type=float, default=1, help='generate: seconds per move (default 1)')
+    parser.add_argument('--random-plies', type=int, default=2, help='generate: random opening moves (default 2)')
+    parser.add_argument('--epsilon', type=float, default=0.05, help='generate: chance of a random move (default 0.05)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--method', choices=(LOGISTIC, SPSA), default=LOGISTIC, help='tune: fitting method')
+    parser.add_argument('--data', nargs='+', help='tune: dataset files (default all of the n and s)')
+    parser.add_argument('--directory', default=DEFAULT_DATA_DIRECTORY, help='where the datasets are (default data)')
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS_DIRECTORY,
+                        help='where the weights are (default weights), also used by the games of generate')
+    args = parser.parse_args()
+
+    if args.mode == 'generate':
+        b_positions = parse_blocks(args.blocks)
+        path = dataset_filename(args.directory, args.n, args.s, b_positions)
+        (total, results) = generate(args.n, args.s, b_positions, args.games, args.workers, args.depth, args.t,
+                                    args.random_plies, args.epsilon, args.seed, args.weights, path)
+        print(F'{path}: {total} positions, X {results[1]} wins, O {results[-1]} wins, {results[0]} ties')
+    else:
+        paths = args.data or sorted(glob.glob(os.path.join(args.directory, F'selfplay-{args.n}-{args.s}-*.bin')))
+        (path, weights, positions, fitted_loss, before, after) = tune(args.n, args.s, paths, args.method,
+                                                                     args.weights)
+        print(F'{path}: weights {weights} from {positions} positions, loss {round(fitted_loss, 4)}')
+        print(F'Winner named by the sign of e2: {round(before * 100, 1)}% with -10^k, {round(after * 100, 1)}% tuned')
+        against = [k for k in range(1, args.s) if weights[k] >= 0]
+        if against:
+            print(F'Warning: the fit gives no credit to windows holding {against} stones of a player only, '
+                  F'check the data or delete {path}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env pypy
+# Long-lived engine service speaking JSON Lines: one request per line in, one
+# response per line out. It reads stdin and writes stdout, or serves
+# connections on a local port with --port.
+#
+#   pypy server.py --workers 4
+#   pypy server.py --port 7777
+#
+# A move request gives the position, the configuration and the time budget:
+#
+#   {"id": 1, "n": 5, "s": 4, "blocks": [[0, 0]], "moves": [[2, 2], [1, 2]], "d": 6, "t": 2}
+#   {"id": 2, "s": 3, "board": ["X..", ".O.", "..."], "algorithm": "pvs", "e": 2}
+#
+# and is answered with the best move and the statistics of its search:
+#
+#   {"id": 1, "x": 3, "y": 2, "value": 110, "depth": 6, "nodes": 5120, "evaluations": 3481, "time": 0.74, ...}
+#
+# The position is a list of [x, y] moves played alternately from X, or the
+# board as n rows of n characters ('-' marks a block) with "turn" saying who
+# is to move when it isn't the player with fewer stones. d, t, algorithm and
+# e default to 4, 5, "alphabeta" and 2. {"command": "ping"} is answered with
+# {"pong": true}, {"command": "quit"} ends the session. Errors are answered
+# with {"id": ..., "error": "..."}.
+#
+# Each worker is a process keeping one game per (n, s, blocks, e)
+# configuration with its transposition tables, MCTS trees, move ordering and
+# book. The heuristic (and the e2 weights) are part of the configuration as
+# the values in the tables depend on them. The requests of a configuration
+# always go to the same worker so that its tables stay warm from one move of
+# a game to the next, different configurations are searched at the same
+# time. Responses may come back in a different order than the requests, the
+# id tells them apart.
+import argparse
+import io
+import json
+import multiprocessing
+import socketserver
+import sys
+import threading
+import time
+
+from book import parse_blocks
+from evaluation import DEFAULT_WEIGHTS_DIRECTORY, load_weights
+from skeleton_tictactoe import Game
+from tournament import parse_algorithm
+
+DEFAULT_PORT = 7777
+DEFAULT_DEPTH = 4
+DEFAULT_TIME = 5
+DEFAULT_ALGORITHM = 'alphabeta'
+DEFAULT_HEURISTIC = 2
+# Games kept by a worker, the one used the longest time ago goes first
+MAX_GAMES = 16
+
+# Returned by EngineServer.submit when the session is over
+QUIT = 'quit'
+
+# The games of the worker process, keyed by configuration
+_games = {}
+
+
+# Checks a move request and turns it into the task sent to a worker
+def parse_request(request):
+    if 'board' in request:
+        rows = request['board']
+        if not isinstance(rows, list) or not all(isinstance(row, str) for row in rows):
+            raise ValueError('board must be a list of strings')
+        n = len(rows)
+        if request.get('n', n) != n or any(len(row) != n for row in rows):
+            raise ValueError('board must have n rows of n cells')
+        cells = {(x, y): rows[y][x] for y in range(n) for x in range(n)}
+        if any(c not in 'XO.-' for c in cells.values()):
+            raise ValueError("board cells must be 'X', 'O', '.' or '-'")
+        x_moves = [cell for cell, c in cells.items() if c == 'X']
+        o_moves = [cell for cell, c in cells.items() if c == 'O']
+        b_positions = [cell for cell, c in cells.items() if c == '-']
+        if 'blocks' in request and set(parse_blocks(request['blocks'])) != set(b_positions):
+            raise ValueError("blocks don't match the '-' cells of board")
+        turn = request.get('turn', 'X' if len(x_moves) <= len(o_moves) else 'O')
+    else:
+        n = request.get('n')
+        if not isinstance(n, int):
+            raise ValueError('n or board is required')
+        b_positions = parse_blocks(request.get('blocks', []))
+        moves = [tuple(move) for move in request.get('moves', [])]
+        x_moves = moves[0::2]
+        o_moves = moves[1::2]
+        turn = request.get('turn', 'X' if len(moves) % 2 == 0 else 'O')
+    s = request.get('s')
+    if not isinstance(s, int):
+        raise ValueError('s is required')
+    if not 3 <= n <= 10 or not 3 <= s <= n:
+        raise ValueError(F'unsupported configuration n={n} s={s}')
+    if turn not in ('X', 'O'):
+        raise ValueError("turn must be 'X' or 'O'")
+    occupied = set()
+    for (x, y) in b_positions + x_moves + o_moves:
+        if not (0 <= x < n and 0 <= y < n):
+            raise ValueError(F'cell {x},{y} is off the board')
+        if (x, y) in occupied:
+            raise ValueError(F'cell {x},{y} is taken twice')
+        occupied.add((x, y))
+    d = request.get('d', DEFAULT_DEPTH)
+    t = request.get('t', DEFAULT_TIME)
+    e = request.get('e', DEFAULT_HEURISTIC)
+    if not isinstance(d, int) or d < 1:
+        raise ValueError('d must be a positive integer')
+    if not isinstance(t, (int, float)) or t <= 0:
+        raise ValueError('t must be a positive number of seconds')
+    if e not in (1, 2):
+        raise ValueError('e must be 1 or 2')
+    return {'id': request.get('id'), 'n': n, 's': s, 'b_positions': sorted(b_positions), 'x_moves': x_moves,
+            'o_moves': o_moves, 'turn': turn, 'd': d, 't': t, 'e': e,
+            'algorithm': parse_algorithm(request.get('algorithm', DEFAULT_ALGORITHM))}
+
+
+def configuration(task):
+    return task['n'], task['s'], tuple(task['b_positions']), task['e']
+
+
+# The game of the configuration of task, a new one when the tuned weights
+# of the configuration changed since its tables were filled
+def worker_game(task):
+    weights = load_weights(DEFAULT_WEIGHTS_DIRECTORY, task['n'], task['s'])
+    key = configuration(task) + (tuple(weights) if weights is not None else None,)
+    game = _games.pop(key, None)
+    if game is None:
+        if len(_games) >= MAX_GAMES:
+            _games.pop(next(iter(_games)))
+        game = Game(recommend=False, quiet=True, ponder=False,
+                    params={'n': task['n'], 's': task['s'], 'b_positions': task['b_positions'], 'd1': task['d'],
+                            'd2': task['d'], 't': task['t'], 'a1': True, 'a2': True, 'e1': task['e'],
+                            'e2': task['e'], 'trace': io.StringIO()})
+    _games[key] = game
+    return game
+
+
+# Searches the position of a move request in a worker process
+def search_position(task):
+    start = time.time()
+    try:
+        game = worker_game(task)
+        game.initialize_game()
+        for (x, y) in task['x_moves']:
+            game.board.place(x, y, 'X')
+        for (x, y) in task['o_moves']:
+            game.board.place(x, y, 'O')
+        result = game.is_end()
+        if result is not None:
+            return {'id': task['id'], 'error': 'the game is over', 'result': result}
+        piece = task['turn']
+        game.player_turn = piece
+        game.d1 = game.d2 = task['d']
+        game.t = task['t']
+        game.a1 = game.a2 = task['algorithm']
+        game.e1 = game.e2 = task['e']
+        game.tt = game.tables[piece]
+        game.tt.new_search(game.stones())
+        game.stats.new_move()
+        algo = game.algorithm(task['algorithm'])
+        (x, y, value) = game.search(algo, max=piece == 'O')
+        # A search out of time before its first iteration still has to move
+        if x is None:
+            (x, y) = game.candidate_moves(piece == 'O')[0]
+    except Exception as error:
+        return {'id': task['id'], 'error': F'{type(error).__name__}: {error}'}
+    return {'id': task['id'], 'x': x, 'y': y, 'value': value, 'depth': game.completed_depth,
+            'nodes': game.stats.node_count, 'evaluations': game.stats.total_evaluations(),
+            'book': game.book_kind, 'time': round(time.time() - start, 4)}
+
+
+class EngineServer:
+    # Deals the move requests out to the workers, one single-process pool
+    # each, picking the worker from the configuration of the request
+
+    def __init__(self, workers=1):
+        self.pools = [multiprocessing.Pool(1) for _ in range(workers)]
+
+    # Handles one request line, reply is called with the response, from
+    # another thread when the request goes to a worker. Returns the pending
+    # result of the worker, None or QUIT. A request that can't be read is
+    # answered with an error, it never stops the server.
+    def submit(self, line, reply):
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request is a JSON object')
+            command = request.get('command', 'move')
+            if command == 'quit':
+                return QUIT
+            if command == 'ping':
+                reply({'id': request.get('id'), 'pong': True})
+                return None
+            if command != 'move':
+                raise ValueError(F'unknown command: {command}')
+            task = parse_request(request)
+        except (ValueError, TypeError) as error:
+            reply({'id': request.get('id') if isinstance(request, dict) else None, 'error': str(error)})
+            return None
+        except Exception as error:
+            reply({'id': request.get('id') if isinstance(request, dict) else None,
+                   'error': F'{type(error).__name__}: {error}'})
+            return None
+        pool = self.pools[hash(configuration(task)) % len(self.pools)]
+        return pool.apply_async(search_position, (task,), callback=reply,
+                                error_callback=lambda error: reply({'id': task['id'], 'error': str(error)}))
+
+    # Answers the request lines one by one and waits for the pending ones
+    # when the lines run out or a quit comes. Returns True after a quit.
+    # Once the other end stops reading, the responses are dropped and no
+    # more requests are taken.
+    def serve(self, lines, write):
+        lock = threading.Lock()
+        closed = threading.Event()
+
+        # Also runs in the result thread of the pools, it must not raise
+        def reply(response):
+            with lock:
+                if closed.is_set():
+                    return
+                try:
+                    write(json.dumps(response) + '\n')
+                except OSError:
+                    closed.set()
+
+        pending = []
+        quit = False
+        for line in lines:
+            if closed.is_set():
+                break
+            if not line.strip():
+                continue
+            result = self.submit(line, reply)
+            if result == QUIT:
+                quit = True
+                break
+            if result is not None:
+                pending.append(result)
+        for result in pending:
+            result.wait()
+        return quit
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+        for pool in self.pools:
+            pool.join()
+
+
+class ConnectionHandler(socketserver.StreamRequestHandler):
+    # One client connection, a quit closes the connection only
+
+    def handle(self):
+        lines = (line.decode() for line in self.rfile)
+
+        def write(text):
+            self.wfile.write(text.encode())
+            self.wfile.flush()
+
+        self.server.engine.serve(lines, write)
+
+
+class LocalServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port, engine):
+        super().__init__(('127.0.0.1', port), ConnectionHandler)
+        self.engine = engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve move requests as JSON Lines.')
+    parser.add_argument('--port', type=int, nargs='?', const=DEFAULT_PORT,
+                        help=F'listen on this local port instead of stdin (default {DEFAULT_PORT})')
+    parser.add_argument('--workers', type=int, default=1, help='requests searched at the same time (default 1)')
+    args = parser.parse_args()
+
+    engine = EngineServer(args.workers)
+    try:
+        if args.port is None:
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+            engine.serve(sys.stdin, write)
+        else:
+            with LocalServer(args.port, engine) as server:
+                print(F'Listening on 127.0.0.1:{args.port}', file=sys.stderr)
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
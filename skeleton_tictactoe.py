@@ -2,31 +2,109 @@
 import sys
 import time
 
+from board import Board
+from engine import SearchEngine
+from book import PositionBook, KINDS, DEFAULT_DIRECTORY
+from evaluation import LineEvaluator, DEFAULT_WEIGHTS_DIRECTORY, load_weights
+from lines import LineIndex
+from mcts import MCTS as TreeSearch, GUIDED
+from output import TraceWriter
+from ordering import MoveOrdering
+from parallel import create_pool, search_root_moves, mcts_playouts
+from ponder import Ponderer
+from stats import SearchStats, MoveProfiler, HEURISTIC, average
+from timemanager import TimeManager
+from transposition import TranspositionTable
+
 
 class Game:
     MINIMAX = 0
     ALPHABETA = 1
     HUMAN = 2
     AI = 3
+    PVS = 4
+    MCTS = 5
 
-    def __init__(self, recommend=True):
+    def __init__(self, recommend=True, tt_size=1 << 18, tt_policy='depth', ordering=True, workers=1,
+                 incremental=True, debug=False, params=None, stats=True, profile=None, book=DEFAULT_DIRECTORY,
+                 symmetric=True, quiet=False, structured=False, threats=True, extension=4, neighbourhood=2,
+                 rollout=GUIDED, ponder=True, batch=True, weights=DEFAULT_WEIGHTS_DIRECTORY):
         self.num_of_games = 0
+        self.engine = SearchEngine()
         self.e1_wins = 0
         self.e2_wins = 0
 
-        self.current_state = []
+        self.board = None
         self.player_turn = ''
-        self.get_parameters()
+        # Heuristics are kept up to date by the board on every move, debug
+        # checks them against a full recompute at every evaluation
+        self.incremental = incremental
+        self.debug = debug
+        # Symmetric positions share their transposition table entries and
+        # symmetric root moves are searched once
+        self.symmetric = symmetric
+        # Threat detection restricts the moves of forcing positions and lets
+        # forcing sequences run up to extension plies past the depth limit
+        self.threats = threats
+        self.extension = extension
+        # Only empty cells at most neighbourhood cells away from a stone are
+        # searched, None searches all of them
+        self.neighbourhood = neighbourhood
+        # Frontier nodes score all their children in one call instead of
+        # searching them one by one
+        self.batch = batch
+        # e2 uses the weights tuned by selfplay.py for the configuration from
+        # this directory when there are some, None keeps the 10^k weights
+        self.weights = weights
+        # MCTS players: playout policy and one tree per piece, kept between
+        # moves
+        self.rollout = rollout
+        self.trees = {}
+        # quiet leaves the console alone, structured writes a JSON Lines
+        # trace next to the text one (AI vs AI only)
+        self.quiet = quiet
+        self.structured = structured
+        self.records = None
+        # params skips the questions, see set_parameters
+        if params is None:
+            self.get_parameters()
+        else:
+            self.set_parameters(**params)
         self.initialize_game()
         self.recommend = recommend
-        self.evaluations = {}
-
-        self.moves = 0
-        self.avg_time = []
-        self.total_heuristic_evaluations = 0
-        self.total_heuristic_depth = {}
-        self.avg_evaluation_depth = []
-        self.avg_recursive_depth = []
+        # Precomputed positions of the configuration from the book directory,
+        # None if there is no book file for it or book is None
+        self.book = PositionBook.open(book, self.n, self.s, self.b_positions)
+        self.book_kind = None
+        # Statistics of the search, the trace is written from them. profile
+        # is 'cprofile' or 'sampling' to profile the search of every move.
+        self.stats = SearchStats(stats)
+        self.profile = profile
+        self.tt_size = tt_size
+        self.tt_policy = tt_policy
+        # One table per player, both kept from move to move (and from game
+        # to game of the same configuration), tt is the one of the player
+        # searching
+        self.tables = {'X': TranspositionTable(tt_size, tt_policy), 'O': TranspositionTable(tt_size, tt_policy)}
+        self.tt = self.tables['X']
+        # The AI player searches in the background while a human opponent
+        # is thinking, see ponder.py
+        self.ponder = ponder
+        self.ponderer = Ponderer()
+        self.clock = TimeManager()
+        self.timed_out = False
+        self.completed_depth = 0
+        # (depth, nodes, seconds) of every completed iteration of the move
+        self.iterations = []
+        self.root_move = None
+        # Move ordering for alphabeta, None keeps the board order
+        self.ordering = None
+        if ordering:
+            self.ordering = MoveOrdering(self.n, self.lines)
+        # Root moves are split across a process pool when workers > 1
+        self.workers = workers
+        self.pool = None
+        self.shared_bound = None
 
         self.final_avg_moves = []
         self.final_avg_time = []
@@ -35,33 +113,57 @@ class Game:
         self.final_avg_evaluation_depth = []
         self.final_avg_recursive_depth = []
 
+    # Copies of the game are sent to the worker processes of the parallel
+    # search, they don't get the open files, the pool or the table
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('f', 'f2', 'records', 'pool', 'shared_bound', 'tt', 'tables', 'book', 'engine', 'trees',
+                     'ponderer'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.engine = SearchEngine()
+
     def restart(self):
-        self.current_state = []
+        self.board = None
         self.player_turn = ''
         self.initialize_game()
-
-        self.evaluations = {}
-        self.moves = 0
-        self.avg_time = []
-        self.total_heuristic_evaluations = 0
-        self.total_heuristic_depth = {}
-        self.avg_evaluation_depth = []
-        self.avg_recursive_depth = []
+        self.stats.new_game()
+        for table in self.tables.values():
+            table.clear()
 
     def initialize_game(self):
-        self.current_state = [['.' for x in range(self.n)] for y in range(self.n)]
-        for b in self.b_positions:
-            self.current_state[b[0]][b[1]] = '-'
+        # Line geometry of the configuration, shared by the board, the
+        # heuristics and the move ordering
+        self.lines = LineIndex.get(self.n, self.s, self.b_positions)
+        self.evaluator = LineEvaluator.get(self.n, self.s, self.b_positions,
+                                           load_weights(self.weights, self.n, self.s))
+        self.board = Board(self.n, self.s, self.b_positions, self.incremental, self.evaluator.weights,
+                           self.symmetric)
         # Player X always plays first
         self.player_turn = 'X'
 
+    # Stones on the board, the age of the transposition table entries
+    def stones(self):
+        return self.board.count('X') + self.board.count('O')
+
+    # list-of-lists view over the bitboard, indexed as current_state[x][y]
+    @property
+    def current_state(self):
+        return [[self.board.get(x, y) for y in range(self.n)] for x in range(self.n)]
+
     def draw_board(self):
-        print()
-        for y in range(0, self.n):
-            for x in range(0, self.n):
-                print(F'{self.current_state[x][y]}', end="")
-            print()
-        print()
+        if self.quiet:
+            return
+        rows = [''.join(self.board.get(x, y) for x in range(self.n)) for y in range(self.n)]
+        print('\n' + '\n'.join(rows) + '\n')
+
+    # Console messages, left out in quiet mode
+    def say(self, text):
+        if not self.quiet:
+            print(text)
 
     def write_board(self):
         self.f.write("\n\n   ")
@@ -70,86 +172,27 @@ class Game:
         self.f.write("\n +-")
         for i in range(self.n):
             self.f.write("---")
-        self.f.write(F"   (move #{self.moves})\n")
+        self.f.write(F"   (move #{self.stats.moves})\n")
 
         for y in range(0, self.n):
             self.f.write(F"{y}|")
             for x in range(0, self.n):
-                self.f.write(F" {self.current_state[x][y]} ")
+                self.f.write(F" {self.board.get(x, y)} ")
             self.f.write("\n")
         self.f.write("\n")
 
     def is_valid(self, px, py):
         if px < 0 or px > self.n - 1 or py < 0 or py > self.n - 1:
             return False
-        elif self.current_state[px][py] != '.':
+        elif self.board.get(px, py) != '.':
             return False
         else:
             return True
 
     def is_end(self):
-        # Column win
-        for column in self.current_state:
-            current = column[0]
-            count = 0
-            for i in range(len(column)):
-                if column[i] == '.' or column[i] == '-':
-                    count = 0
-                elif current != column[i]:
-                    count = 1
-                elif column[i] == current:
-                    count += 1
-                current = column[i]
-                if count == self.s:
-                    return current
-
-        # Horizontal win
-        for i in range(self.n):
-            count = 0
-            current = self.current_state[0][i]
-            for column in self.current_state:
-                if column[i] == '.' or column[i] == '-':
-                    count = 0
-                elif current != column[i]:
-                    count = 1
-                elif current == column[i]:
-                    count += 1
-                current = column[i]
-                if count == self.s:
-                    return current
-
-        mat = [[0, 1, 2, 3, 9],
-               [4, 5, 6, 7, 0],
-               [8, 9, 10, 11, 18],
-               [1, 2, 3, 7, 0],
-               [4, 8, 5, 7, 10]]
-
-        diagonals = []
-        for start in range(self.n):
-            for j in range(self.n - self.s + 1):
-                diagonal = [self.current_state[start + i][i + j] for i in range(self.s) if
-                            0 <= i + j < self.n and 0 <= start + i < self.n]
-                if len(diagonal) >= self.s:
-                    diagonals.append(diagonal)
-                diagonal = [self.current_state[start + i][-i - j - 1] for i in range(self.s) if
-                            0 <= i + j < self.n and 0 <= start + i < self.n]
-                if len(diagonal) >= self.s:
-                    diagonals.append(diagonal)
-
-        for diag in diagonals:
-            if diag.count('X') == self.s:
-                return 'X'
-            elif diag.count('O') == self.s:
-                return 'O'
-
-        # Is whole board full?
-        for i in range(self.n):
-            for j in range(self.n):
-                # There's an empty field, we continue the game
-                if self.current_state[i][j] == '.':
-                    return None
-        # It's a tie!
-        return '.'
+        # Only lines through the last placed cell are checked as moves are
+        # made, '.' means no line can be won any more and it's a tie
+        return self.board.status()
 
     def check_end(self):
         game_over = False
@@ -158,7 +201,7 @@ class Game:
         if self.result is not None:
             if self.result == 'X':
                 game_over = True
-                print('The winner is X!\n')
+                self.say('The winner is X!\n')
                 if self.player1_type == 'AI' and self.player2_type == 'AI':
                     self.f.write('The winner is X!')
 
@@ -168,7 +211,7 @@ class Game:
                     self.e2_wins += 1
             elif self.result == 'O':
                 game_over = True
-                print('The winner is O!\n')
+                self.say('The winner is O!\n')
                 if self.player1_type == 'AI' and self.player2_type == 'AI':
                     self.f.write('The winner is O!')
 
@@ -178,29 +221,33 @@ class Game:
                     self.e2_wins += 1
             elif self.result == '.':
                 game_over = True
-                print("It's a tie!\n")
+                self.say("It's a tie!\n")
                 if self.player1_type == 'AI' and self.player2_type == 'AI':
                     self.f.write("It's a tie!")
             self.initialize_game()
         if game_over:
             if self.player1_type == 'AI' and self.player2_type == 'AI':
-                self.f.write(F'\n\n6(b)i Average evaluation time:  {sum(self.avg_time)/len(self.avg_time)} s')
-                self.f.write(F'\n6(b)ii  Total heuristic evaluations: {self.total_heuristic_evaluations}')
-                self.f.write(F'\n6(b)iii Evaluations by depth: {self.total_heuristic_depth}')
-                self.f.write(F'\n6(b)iv  Average evaluation depth: {sum(self.avg_evaluation_depth)/len(self.avg_evaluation_depth)}')
-                # self.f.write(F'\n6(b)v   Average recursion depth: {sum(self.avg_recursive_depth)/len(self.avg_recursive_depth)}')
-                self.f.write(F'\n6(b)vi  Total moves: {self.moves}')
-
-                self.final_avg_moves.append(self.moves)
-                self.final_avg_time += self.avg_time
-                self.final_total_heuristic_evaluations += self.total_heuristic_evaluations
-                for depth in self.total_heuristic_depth:
+                self.f.write(self.stats.game_report())
+                if self.records is not None:
+                    self.records.record('game', game=self.num_of_games, result=self.result, moves=self.stats.moves,
+                                        move_times=self.stats.move_times,
+                                        evaluations=sum(self.stats.game_evaluations.values()),
+                                        evaluations_by_depth=self.stats.game_evaluations,
+                                        evaluation_depths=self.stats.evaluation_depths,
+                                        recursion_depths=self.stats.recursion_depths)
+                    self.records.flush()
+                self.f.flush()
+
+                self.final_avg_moves.append(self.stats.moves)
+                self.final_avg_time += self.stats.move_times
+                self.final_total_heuristic_evaluations += sum(self.stats.game_evaluations.values())
+                for depth in self.stats.game_evaluations:
                     if depth in self.final_total_heuristic_depth.keys():
-                        self.final_total_heuristic_depth[depth] += self.total_heuristic_depth[depth]
+                        self.final_total_heuristic_depth[depth] += self.stats.game_evaluations[depth]
                     else:
-                        self.final_total_heuristic_depth[depth] = self.total_heuristic_depth[depth]
-                self.final_avg_evaluation_depth += self.avg_evaluation_depth
-                # self.final_avg_recursive_depth += self.avg_recursive_depth
+                        self.final_total_heuristic_depth[depth] = self.stats.game_evaluations[depth]
+                self.final_avg_evaluation_depth += self.stats.evaluation_depths
+                self.final_avg_recursive_depth += self.stats.recursion_depths
         return self.result
 
     def input_move(self):
@@ -220,175 +267,262 @@ class Game:
             self.player_turn = 'X'
         return self.player_turn
 
-    def minimax(self, max=False, count=0, start=time.time()):
-        # count is for the max depth allowed
-        # Minimizing for 'X' and maximizing for 'O'
-        # Possible values are:
-        # -1 - win for 'X'
-        # 0  - a tie
-        # 1  - loss for 'X'
-        # We're initially setting it to 2 or -2 as worse than the worst case:
-        x = None
-        y = None
-
-        h_result = sys.maxsize
-        if max:
-            h_result = -sys.maxsize - 1
-        result = self.is_end()
-
-        if result == 'X':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
-            return x, y, h_result
-        elif result == 'O':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
-            return x, y, h_result
-        elif result == '.':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
+    # The searches run in the engine, see engine.py. They return the best
+    # move at count and its value, for O (max) except negascout, whose values
+    # are for the side to move.
+    def minimax(self, max=False, count=0, max_depth=None):
+        if max_depth is None:
+            max_depth = self.max_depth()
+        engine = self.engine
+        engine.prepare(self, max_depth)
+        h_result = engine.minimax(max, count, max_depth)
+        engine.flush_stats()
+        return engine.best_move[0], engine.best_move[1], h_result
+
+    def alphabeta(self, alpha=-sys.maxsize - 1, beta=sys.maxsize, max=False, count=0, max_depth=None):
+        if max_depth is None:
+            max_depth = self.max_depth()
+        engine = self.engine
+        engine.prepare(self, max_depth)
+        h_result = engine.alphabeta(alpha, beta, max, count, max_depth)
+        engine.flush_stats()
+        return engine.best_move[0], engine.best_move[1], h_result
+
+    def negascout(self, alpha, beta, max=False, count=0, max_depth=None):
+        if max_depth is None:
+            max_depth = self.max_depth()
+        engine = self.engine
+        engine.prepare(self, max_depth)
+        h_result = engine.negascout(alpha, beta, max, count, max_depth)
+        engine.flush_stats()
+        return engine.best_move[0], engine.best_move[1], h_result
+
+    # The engine keeps the flags the recursion reads
+    @property
+    def timed_out(self):
+        return self.engine.timed_out
+
+    @timed_out.setter
+    def timed_out(self, value):
+        self.engine.timed_out = value
+
+    @property
+    def root_move(self):
+        return self.engine.root_move
+
+    @root_move.setter
+    def root_move(self, value):
+        self.engine.root_move = value
+
+    # Aspiration window around the value of the previous iteration, widened
+    # on the failing side until the value falls inside. Every failure at
+    # least doubles the window. Returns the value for O like the other
+    # searches.
+    def aspiration(self, max, depth, previous):
+        color = 1 if max else -1
+        alpha = -sys.maxsize
+        beta = sys.maxsize
+        delta = self.aspiration_delta()
+        if previous is not None:
+            alpha = color * previous - delta
+            beta = color * previous + delta
+        while True:
+            (x, y, value) = self.negascout(alpha, beta, max=max, max_depth=depth)
+            if self.timed_out:
+                break
+            delta *= 4
+            if delta < beta - alpha:
+                delta = beta - alpha
+            if value <= alpha and alpha > -sys.maxsize:
+                alpha = value - delta if value - delta > -sys.maxsize else -sys.maxsize
+            elif value >= beta and beta < sys.maxsize:
+                beta = value + delta if value + delta < sys.maxsize else sys.maxsize
             else:
-                self.evaluations[count] = 1
-            return x, y, h_result
-
+                break
+        return x, y, color * value
+
+    # Half width of the first aspiration window, in units of the heuristic
+    def aspiration_delta(self):
+        if (self.e1 if self.player_turn == 'X' else self.e2) == 1:
+            return 1
+        # Tuned weights are negative (see selfplay.py) and can be small or zero
+        return max(1, abs(self.evaluator.weights[2]) // 2)
+
+    # Value for O of the position after a root move of the side max, searched
+    # to depth with the window alpha..beta (also for O)
+    def search_child(self, algo, max, alpha, beta, depth):
+        if algo == self.MINIMAX:
+            return self.minimax(max=not max, count=1, max_depth=depth)[2]
+        if algo == self.ALPHABETA:
+            return self.alphabeta(alpha, beta, max=not max, count=1, max_depth=depth)[2]
+        if max:
+            return -self.negascout(-beta, -alpha, max=False, count=1, max_depth=depth)[2]
+        return self.negascout(alpha, beta, max=True, count=1, max_depth=depth)[2]
+
+    # Moves worth searching for the side max at the root
+    def candidate_moves(self, max):
+        self.engine.prepare(self, 0)
+        return list(self.engine.candidate_moves(max, 0))
+
+    # Monte Carlo tree search for the whole time budget, along with one tree
+    # per worker process when workers > 1. The most visited root move is
+    # played, its value is the expected result for O between -1 and 1.
+    def mcts_search(self, max):
+        piece = 'O' if max else 'X'
+        tree = self.mcts_tree(piece)
+        pending = None
+        if self.workers > 1:
+            if self.pool is None:
+                (self.pool, self.shared_bound) = create_pool(self.workers)
+            pending = self.pool.map_async(mcts_playouts, [(self, piece, k) for k in range(self.workers)])
+        totals = {}
+        for (move, visits, wins) in tree.search(self.board, piece, self.clock, self.stats):
+            totals[move] = [visits, wins]
+        self.completed_depth = tree.depth
+        if pending is not None:
+            for result in pending.get():
+                self.stats.merge(result['stats'])
+                if result['depth'] > self.completed_depth:
+                    self.completed_depth = result['depth']
+                for (move, visits, wins) in result['children']:
+                    total = totals.setdefault(move, [0, 0])
+                    total[0] += visits
+                    total[1] += wins
+        if not totals:
+            return None, None, None
+        (move, (visits, wins)) = sorted(totals.items(), key=lambda item: -item[1][0])[0]
+        rate = wins / visits
+        if not max:
+            rate = 1 - rate
+        return move[0], move[1], round(2 * rate - 1, 4)
+
+    # Tree of the MCTS player piece
+    def mcts_tree(self, piece):
+        if piece not in self.trees:
+            self.trees[piece] = TreeSearch(self.n, self.s, self.b_positions, self.rollout,
+                                           neighbourhood=self.neighbourhood)
+        return self.trees[piece]
+
+    # Search algorithm of a1/a2
+    def algorithm(self, a):
+        if a == 'pvs':
+            return self.PVS
+        if a == 'mcts':
+            return self.MCTS
+        if a:
+            return self.ALPHABETA
+        return self.MINIMAX
+
+    def max_depth(self):
         if self.player_turn == 'X':
-            max_depth = self.d1
-        else:
-            max_depth = self.d2
-
-        now = time.time()
-        if now - start < self.t - 0.005:
-            for i in range(self.n):
-                for j in range(self.n):
-                    if self.current_state[i][j] == '.' and count < max_depth:
-                        count += 1
-                        # leaf node
-                        if count == max_depth - 1:
-                            h_result = self.call_heuristic()
-                            if count in self.evaluations.keys():
-                                self.evaluations[count] += 1
-                            else:
-                                self.evaluations[count] = 1
-                        if max:
-                            self.current_state[i][j] = 'O'
-                            (_, _, h) = self.minimax(max=False, start=start, count=count)
-                            if h >= h_result:
-                                h_result = h
-                                x = i
-                                y = j
-                        else:
-                            self.current_state[i][j] = 'X'
-                            (_, _, h) = self.minimax(max=True, start=start, count=count)
-                            if h <= h_result:
-                                h_result = h
-                                x = i
-                                y = j
-
-                        self.current_state[i][j] = '.'
-        else:
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
+            return self.d1
+        return self.d2
+
+    # Iterative deepening: search depth 1, 2, 3... up to d1/d2 and keep the
+    # move of the last iteration that completed within the time budget t.
+    # Positions found in the book are played without searching.
+    def search(self, algo, max):
+        self.clock.start(self.t)
+        self.completed_depth = 0
+        self.iterations = []
+        self.root_move = None
+        self.book_kind = None
+        if self.book is not None:
+            entry = self.book.probe(self.board, max)
+            if entry is not None and entry[0] is not None and self.is_valid(entry[0], entry[1]):
+                (x, y, value, kind, depth) = entry
+                self.book_kind = KINDS[kind]
+                self.completed_depth = depth
+                # Book values are good for the side to move when positive
+                if not max:
+                    value = -value
+                return x, y, value
+        if algo == self.MCTS:
+            return self.mcts_search(max)
+        if self.ordering is not None:
+            self.ordering.new_search()
+        (x, y, h_result) = (None, None, None)
+        for depth in range(1, self.max_depth() + 1):
+            if not self.clock.can_start_iteration():
+                break
+            self.timed_out = False
+            iteration_start = time.time()
+            iteration_nodes = self.stats.node_count
+            if self.workers > 1:
+                result = self.parallel_root(algo, max, depth)
+            elif algo == self.MINIMAX:
+                result = self.minimax(max=max, max_depth=depth)
+            elif algo == self.PVS:
+                result = self.aspiration(max, depth, h_result)
             else:
-                self.evaluations[count] = 1
+                result = self.alphabeta(max=max, max_depth=depth)
+            if self.timed_out:
+                break
+            self.clock.end_iteration(time.time() - iteration_start)
+            self.iterations.append((depth, self.stats.node_count - iteration_nodes, time.time() - iteration_start))
+            (x, y, h_result) = result
+            self.completed_depth = depth
+            self.root_move = (x, y)
+            # A finished game below the root can't change with more depth
+            if self.board.empty_count <= depth:
+                break
+        self.timed_out = False
         return x, y, h_result
 
-    def alphabeta(self, alpha=-2, beta=2, max=False, count=0, start=time.time()):
-        # Minimizing for 'X' and maximizing for 'O'
-        # Possible values are:
-        # -1 - win for 'X'
-        # 0  - a tie
-        # 1  - loss for 'X'
-        # We're initially setting it to 2 or -2 as worse than the worst case:
-        x = None
-        y = None
-
-        h_result = sys.maxsize
+    # Root split in the Young Brothers Wait style: the first root move is
+    # searched here to get a bound, then the remaining moves are dealt out to
+    # the worker processes, which share the best value found so far
+    def parallel_root(self, algo, max, depth):
+        if self.pool is None:
+            (self.pool, self.shared_bound) = create_pool(self.workers)
+
+        moves = self.candidate_moves(max)
+        if self.ordering is not None:
+            moves = self.ordering.order(moves, 0, self.root_move)
+        (x, y) = moves[0]
+        alpha = -sys.maxsize
+        beta = sys.maxsize
         if max:
-            h_result = -sys.maxsize - 1
-
-        result = self.is_end()
-        if result == 'X':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
-            return x, y, h_result
-        elif result == 'O':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
+            self.board.place(x, y, 'O')
+        else:
+            self.board.place(x, y, 'X')
+        h_result = self.search_child(algo, max, alpha, beta, depth)
+        self.board.remove(x, y)
+        if self.timed_out or len(moves) == 1:
             return x, y, h_result
-        elif result == '.':
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
+
+        if max and h_result > alpha:
+            alpha = h_result
+        elif not max and h_result < beta:
+            beta = h_result
+        if algo != self.MINIMAX and alpha >= beta:
             return x, y, h_result
 
-        if self.player_turn == 'X':
-            max_depth = self.d1
-        else:
-            max_depth = self.d2
-
-        now = time.time()
-        if now - start < self.t - 0.005:
-            for i in range(self.n):
-                for j in range(self.n):
-                    if self.current_state[i][j] == '.' and count < max_depth:
-                        count += 1
-                        # leaf node
-                        if count == max_depth - 1:
-                            h_result = self.call_heuristic()
-                            if count in self.evaluations.keys():
-                                self.evaluations[count] += 1
-                            else:
-                                self.evaluations[count] = 1
-                        if max:
-                            self.current_state[i][j] = 'O'
-                            (_, _, h) = self.alphabeta(alpha, beta, max=False, start=start, count=count)
-                            if h >= h_result:
-                                h_result = h
-                                x = i
-                                y = j
-                        else:
-                            self.current_state[i][j] = 'X'
-                            (_, _, h) = self.alphabeta(alpha, beta, max=True, start=start, count=count)
-                            if h <= h_result:
-                                h_result = h
-                                x = i
-                                y = j
-                        self.current_state[i][j] = '.'
-                        if max:
-                            if h_result >= beta:
-                                return (x, y, h_result)
-                            if h_result > alpha:
-                                alpha = h_result
-                        else:
-                            if h_result <= alpha:
-                                return (x, y, h_result)
-                            if h_result < beta:
-                                beta = h_result
-        else:
-            h_result = self.call_heuristic()
-            if count in self.evaluations.keys():
-                self.evaluations[count] += 1
-            else:
-                self.evaluations[count] = 1
+        self.shared_bound.value = h_result
+        tasks = []
+        for k in range(self.workers):
+            share = moves[1 + k::self.workers]
+            if share:
+                tasks.append((self, algo, max, depth, alpha, beta, share))
+        for result in self.pool.map(search_root_moves, tasks):
+            self.stats.merge(result['stats'])
+            self.tt.hits += result['tt'][0]
+            self.tt.misses += result['tt'][1]
+            self.tt.collisions += result['tt'][2]
+            if self.ordering is not None:
+                self.ordering.cutoffs += result['cutoffs'][0]
+                self.ordering.first_move_cutoffs += result['cutoffs'][1]
+            if result['timed_out']:
+                self.timed_out = True
+            h = result['value']
+            if h is not None and ((max and h > h_result) or (not max and h < h_result)):
+                (x, y) = result['move']
+                h_result = h
         return x, y, h_result
 
     def call_heuristic(self):
+        if self.stats.timing:
+            started = time.perf_counter()
         if self.player_turn == 'X':
             if self.e1 == 1:
                 result = self.heuristic_e1()
@@ -400,103 +534,56 @@ class Game:
             else:
                 result = self.heuristic_e2()
 
+        if self.stats.timing:
+            self.stats.add_time(HEURISTIC, time.perf_counter() - started)
+        return result
+
+    # Heuristic values of all the children of the current position reached
+    # by placing piece on one of moves, in one call: the frontier nodes of
+    # the searches score their children this way. The heuristic is picked
+    # once, e2 comes from the window counts of the board when they are kept,
+    # else from LineEvaluator.score_children (with NumPy on large batches).
+    def call_heuristic_children(self, moves, piece):
+        if self.stats.timing:
+            started = time.perf_counter()
+        step = 1 if piece == 'X' else -1
+        if (self.e1 if self.player_turn == 'X' else self.e2) == 1:
+            result = [self.heuristic_e1() + step] * len(moves)
+        elif self.incremental:
+            result = self.board.child_scores(moves, piece)
+            if self.debug:
+                assert result == self.evaluator.score_children(self.board, moves, piece)
+        else:
+            result = self.evaluator.score_children(self.board, moves, piece)
+
+        if self.stats.timing:
+            self.stats.add_time(HEURISTIC, time.perf_counter() - started)
         return result
 
     # count num X and num O (#X-#O)
     def heuristic_e1(self):
-        num_X = 0
-        num_O = 0
-        for column in self.current_state:
-            num_X += column.count('X')
-            num_O += column.count('O')
-        return num_X - num_O
-
-    # count how many X we have in column, rows and diagonals, same for Os
+        if self.incremental:
+            if self.debug:
+                assert self.board.material == self.board.count('X') - self.board.count('O')
+            return self.board.material
+        return self.board.count('X') - self.board.count('O')
+
+    # score every length-s window of the columns, rows and diagonals:
+    # 10^k for k X alone in a window, -10^k for k O alone in a window (or
+    # the tuned weights of the configuration, see selfplay.py)
     def heuristic_e2(self):
-        diagonals = []
-        for j in range(self.n - self.s + 1):
-            diagonal = [self.current_state[i][i + j] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-            diagonal = [self.current_state[i][-i - j - 1] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-        for start in range(1, self.n):
-            j = 0
-            diagonal = [self.current_state[start + i][i + j] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= start + i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-            diagonal = [self.current_state[start + i][-i - j - 1] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= start + i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-            j = self.n - 1
-            diagonal = [self.current_state[start + i][i + j] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= start + i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-            diagonal = [self.current_state[start + i][-i - j - 1] for i in range(self.n) if
-                        0 <= i + j < self.n and 0 <= start + i < self.n]
-            if len(diagonal) >= self.s:
-                diagonals.append(diagonal)
-
-            # Horizontal win
-            horizontals = []
-            for i in range(self.n):
-                row = []
-                for column in self.current_state:
-                    row.append(column[i])
-                horizontals.append(row)
-
-            all = diagonal + horizontals + self.current_state
-
-            total = 0
-            for list in all:
-                current = list[0]
-                current_score = 1
-                for i in range(1, len(list)):
-                    if list[i] != '.' and list[i] != '-':
-                        if current == '':
-                            current = list[i]
-                        if current == list[i]:
-                            current_score *= 10
-                        elif current != list[i] and current == 'X':
-                            if current_score != 1:
-                                total += current_score
-                            current_score = 10
-                            current = 'O'
-                        elif current != list[i] and current == 'O':
-                            if current_score != 1:
-                                total -= current_score
-                            current_score = 10
-                            current = 'X'
-                    else:
-                        if current == 'X':
-                            if current_score != 1:
-                                total += current_score
-                        elif current == 'O':
-                            if current_score != 1:
-                                total -= current_score
-                        current_score = 1
-                        current = ''
-            return total
+        if self.incremental:
+            if self.debug:
+                assert self.board.e2_score == self.evaluator.score(self.board)
+            return self.board.e2_score
+        return self.evaluator.score(self.board)
 
     def play(self):
         self.num_of_games += 1
         if self.player1_type == 'AI' and self.player2_type == 'AI':
             self.f.write(F"\n\n\n***** GAME {self.num_of_games} *****")
-        if self.a1:
-            algo1 = self.ALPHABETA
-        else:
-            algo1 = self.MINIMAX
-
-        if self.a2:
-            algo2 = self.ALPHABETA
-        else:
-            algo2 = self.MINIMAX
+        algo1 = self.algorithm(self.a1)
+        algo2 = self.algorithm(self.a2)
 
         if self.player1_type == 'H':
             player_x = self.HUMAN
@@ -515,69 +602,81 @@ class Game:
             if self.check_end():
                 break
 
-            self.evaluations = {}
+            self.stats.new_move()
+            self.tt = self.tables[self.player_turn]
+            self.tt.new_search(self.stones())
+            if self.profile is not None:
+                profiler = MoveProfiler(self.profile)
+                profiler.start()
             start = time.time()
-            if algo1 == self.MINIMAX and self.player_turn == 'X':
-                (x, y, h_result) = self.minimax(max=False, start=start)
-            elif self.player_turn == 'X':  # algo == self.ALPHABETA
-                (x, y, h_result) = self.alphabeta(max=False, start=start)
-            if algo2 == self.MINIMAX and self.player_turn == 'O':
-                (x, y, h_result) = self.minimax(max=True, start=start)
-            elif self.player_turn == 'O':
-                (x, y, h_result) = self.alphabeta(max=True, start=start)
+            if self.player_turn == 'X':
+                algo = algo1
+                (x, y, h_result) = self.search(algo, max=False)
+            else:
+                algo = algo2
+                (x, y, h_result) = self.search(algo, max=True)
             end = time.time()
+            if self.profile is not None:
+                self.write_profile(profiler.stop())
 
             if x is None or y is None:
-                for i in range(self.n):
-                    for j in range(self.n):
-                        if self.current_state[i][j] == '.':
-                            x = i
-                            y = j
-                            break
+                (x, y) = self.board.empty_cells()[0]
 
             if (self.player_turn == 'X' and player_x == self.HUMAN) or (
                     self.player_turn == 'O' and player_o == self.HUMAN):
                 if self.recommend:
-                    print(F'Evaluation time: {round(end - start, 7)}s')
-                    print(F'Recommended move: x = {x}, y = {y}')
-                    print(F'Heuristic result: {h_result}')
+                    self.say(F'Evaluation time: {round(end - start, 7)}s')
+                    self.say(F'Search depth: {self.completed_depth}')
+                    self.say(F'Recommended move: x = {x}, y = {y}')
+                    self.say(F'Heuristic result: {h_result}')
+                # The AI opponent ponders on the recommended move
+                opponent = 'O' if self.player_turn == 'X' else 'X'
+                pondering = self.ponder and (player_o if opponent == 'O' else player_x) == self.AI
+                if pondering:
+                    self.ponderer.start(self, opponent, algo2 if opponent == 'O' else algo1, (x, y))
                 (x, y) = self.input_move()
+                if pondering:
+                    self.ponderer.stop()
+                    if self.ponderer.hit((x, y)):
+                        self.say(F'Ponder hit, search depth {self.ponderer.depth} reached while waiting')
 
             if (self.player_turn == 'X' and player_x == self.AI) or (self.player_turn == 'O' and player_o == self.AI):
-                print(F'Evaluation time: {round(end - start, 7)}s')
-                print(F'Player {self.player_turn} under AI control plays: x = {x}, y = {y}')
-                print(F'Heuristic result: {h_result}')
+                self.say(F'Evaluation time: {round(end - start, 7)}s')
+                self.say(F'Search depth: {self.completed_depth}')
+                self.say(F'Player {self.player_turn} under AI control plays: x = {x}, y = {y}')
+                self.say(F'Heuristic result: {h_result}')
 
             if player_o == self.AI and player_x == self.AI:
                 self.f.write(F"\nPlayer {self.player_turn} under AI control plays: x = {x}, y = {y}\n")
-                self.moves += 1
+                self.stats.end_move(round(end - start, 7))
 
                 self.f.write(F"\ni. Heuristic evaluation time: {round(end - start, 7)}s")
-                self.avg_time.append(round(end - start, 7))
-
-                values = self.evaluations.values()
-                total = sum(values)
-                self.f.write(F"\nii. Heuristic evaluations: {total}")
-                self.total_heuristic_evaluations += total
-
-                self.f.write(F"\niii. Evaluations by depth: {self.evaluations}")
-                for depth in self.evaluations:
-                    if depth in self.total_heuristic_depth.keys():
-                        self.total_heuristic_depth[depth] += self.evaluations[depth]
-                    else:
-                        self.total_heuristic_depth[depth] = self.evaluations[depth]
-
-                if total != 0:
-                    total_sum = sum(k*v for k, v in self.evaluations.items())/total
-                else:
-                    total_sum = 0
-                self.f.write(F"\niv. Average evaluation depth: {total_sum}")
-                self.avg_evaluation_depth.append(total_sum)
-
-                self.f.write(F"\nv. Average recursion depth:")
-                # self.avg_recursive_depth.append()
-
-            self.current_state[x][y] = self.player_turn
+                self.f.write(F"\n   Completed search depth: {self.completed_depth}")
+                if self.book_kind is not None:
+                    self.f.write(F" ({self.book_kind} book move)")
+                self.f.write(F"\nii. Heuristic evaluations: {self.stats.total_evaluations()}")
+                self.f.write(F"\n    TT hits: {self.tt.hits}, misses: {self.tt.misses}, "
+                             F"collisions: {self.tt.collisions}")
+                if self.ordering is not None and algo in (self.ALPHABETA, self.PVS):
+                    self.f.write(F"\n    Cutoffs on first move: "
+                                 F"{self.ordering.first_move_cutoffs}/{self.ordering.cutoffs}"
+                                 F" ({round(self.ordering.first_move_ratio() * 100, 1)}%)")
+                self.f.write(F"\niii. Evaluations by depth: {self.stats.evaluations}")
+                self.f.write(F"\niv. Average evaluation depth: {self.stats.average_evaluation_depth()}")
+                self.f.write(F"\nv. Average recursion depth: {self.stats.average_recursion_depth()}")
+                self.f.write(self.stats.move_details())
+                if self.records is not None:
+                    self.records.record('move', game=self.num_of_games, move=self.stats.moves,
+                                        player=self.player_turn, x=x, y=y, value=h_result,
+                                        time=round(end - start, 7), depth=self.completed_depth, book=self.book_kind,
+                                        evaluations=self.stats.total_evaluations(),
+                                        evaluations_by_depth=self.stats.evaluations,
+                                        average_evaluation_depth=self.stats.average_evaluation_depth(),
+                                        average_recursion_depth=self.stats.average_recursion_depth(),
+                                        nodes=self.stats.node_count, cutoffs=self.stats.cutoffs,
+                                        tt=[self.tt.hits, self.tt.misses, self.tt.collisions])
+
+            self.board.place(x, y, self.player_turn)
             self.switch_player()
 
     def get_parameters(self):
@@ -604,21 +703,33 @@ class Game:
 
         self.t = int(input('Enter the maximum allowed time (in seconds) to return a move: '))
 
-        mini_or_alpha = int(input('Enter 1 to use minimax or 2 to use alphabeta for player 1: '))
-        while mini_or_alpha != 1 and mini_or_alpha != 2:
-            mini_or_alpha = int(input('Enter 1 to use minimax or 2 to use alphabeta for player 1: '))
+        mini_or_alpha = int(input('Enter 1 to use minimax, 2 to use alphabeta, 3 to use PVS or 4 to use MCTS '
+                                  'for player 1: '))
+        while mini_or_alpha not in (1, 2, 3, 4):
+            mini_or_alpha = int(input('Enter 1 to use minimax, 2 to use alphabeta, 3 to use PVS or 4 to use MCTS '
+                                      'for player 1: '))
         if mini_or_alpha == 1:
             self.a1 = False
-        else:
+        elif mini_or_alpha == 2:
             self.a1 = True
+        elif mini_or_alpha == 3:
+            self.a1 = 'pvs'
+        else:
+            self.a1 = 'mcts'
 
-        mini_or_alpha = int(input('Enter 1 to use minimax or 2 to use alphabeta for player 2: '))
-        while mini_or_alpha != 1 and mini_or_alpha != 2:
-            mini_or_alpha = int(input('Enter 1 to use minimax or 2 to use alphabeta for player 2: '))
+        mini_or_alpha = int(input('Enter 1 to use minimax, 2 to use alphabeta, 3 to use PVS or 4 to use MCTS '
+                                  'for player 2: '))
+        while mini_or_alpha not in (1, 2, 3, 4):
+            mini_or_alpha = int(input('Enter 1 to use minimax, 2 to use alphabeta, 3 to use PVS or 4 to use MCTS '
+                                      'for player 2: '))
         if mini_or_alpha == 1:
             self.a2 = False
-        else:
+        elif mini_or_alpha == 2:
             self.a2 = True
+        elif mini_or_alpha == 3:
+            self.a2 = 'pvs'
+        else:
+            self.a2 = 'mcts'
 
         e1_or_e2 = int(input('Enter 1 to use heuristic 1 or 2 to use heuristic 2 for player 1: '))
         while e1_or_e2 != 1 and e1_or_e2 != 2:
@@ -633,33 +744,88 @@ class Game:
         self.player1_type = input('Enter H or AI for player 1: ')
         self.player2_type = input('Enter H or AI for player 2: ')
 
+        self.open_trace()
+
+    # Same parameters as get_parameters without asking for them, a1/a2 are
+    # True for alphabeta, False for minimax, 'pvs' or 'mcts'. trace and records replace the gameTrace files
+    # (AI vs AI only).
+    def set_parameters(self, n, s, d1, d2, t, a1, a2, e1, e2, b_positions=(), player1_type='AI',
+                       player2_type='AI', trace=None, records=None):
+        self.n = n
+        self.b_positions = [tuple(b) for b in b_positions]
+        self.b = len(self.b_positions)
+        self.s = s
+        self.d1 = d1
+        self.d2 = d2
+        self.t = t
+        self.a1 = a1
+        self.a2 = a2
+        self.e1 = e1
+        self.e2 = e2
+        self.player1_type = player1_type
+        self.player2_type = player2_type
+        self.open_trace(trace, records)
+
+    # The traces are written through TraceWriter, off the game loop
+    def open_trace(self, trace=None, records=None):
         if self.player1_type == 'AI' and self.player2_type == 'AI':
-            self.f = open(F"gameTrace-{self.n}{self.b}{self.s}{self.t}.txt", "a")
+            if trace is None:
+                self.f = TraceWriter(open(self.trace_filename(), "a"))
+            else:
+                self.f = TraceWriter(trace, owns=False)
+            if self.structured:
+                if records is None:
+                    self.records = TraceWriter(open(self.records_filename(), "a"))
+                else:
+                    self.records = TraceWriter(records, owns=False)
+                self.records.record('configuration', n=self.n, b=self.b, s=self.s, t=self.t,
+                                    blocks=self.b_positions,
+                                    players=[{'type': self.player1_type, 'd': self.d1, 'a': self.a1, 'e': self.e1},
+                                             {'type': self.player2_type, 'd': self.d2, 'a': self.a2, 'e': self.e2}])
             self.f.write(F"n={self.n} b={self.b} s={self.s} t={self.t}")
             if self.b_positions:
                 self.f.write(F"\nblocks: {self.b_positions}")
             self.f.write(F"\n\nPlayer 1: {self.player1_type} d={self.d1} a={self.a1} e{self.e1}")
             self.f.write(F"\nPlayer 2: {self.player2_type} d={self.d2} a={self.a2} e{self.e2}")
 
-    def write_scoreboard(self):
+    def write_profile(self, report):
+        with open(F"profile-{self.n}{self.b}{self.s}{self.t}.txt", "a") as f:
+            f.write(F"\n***** GAME {self.num_of_games} move {self.stats.moves + 1} (player {self.player_turn}) *****\n")
+            f.write(report)
+
+    def close_trace(self):
         if self.player1_type == 'AI' and self.player2_type == 'AI':
             self.f.close()
-            self.f2 = open("scoreboard.txt", "a")
+            if self.records is not None:
+                self.records.close()
+
+    def trace_filename(self):
+        return F"gameTrace-{self.n}{self.b}{self.s}{self.t}.txt"
+
+    def records_filename(self):
+        return F"gameTrace-{self.n}{self.b}{self.s}{self.t}.jsonl"
+
+    def write_scoreboard(self):
+        if self.player1_type == 'AI' and self.player2_type == 'AI':
+            self.close_trace()
+            self.f2 = TraceWriter(open("scoreboard.txt", "a"), background=False)
             self.f2.write(F"n={self.n} b={self.b} s={self.s} t={self.t}\n")
             self.f2.write(F"\nPlayer 1: {self.player1_type} d={self.d1} a={self.a1}")
             self.f2.write(F"\nPlayer 2: {self.player2_type} d={self.d2} a={self.a2}")
             self.f2.write(F"\n\n{self.num_of_games} games")
             self.f2.write(F"\n\nTotal wins for heuristic e1: {self.e1_wins} ({self.e1_wins/self.num_of_games*100}%)")
             self.f2.write(F"\nTotal wins for heuristic e2: {self.e2_wins} ({self.e2_wins / self.num_of_games * 100}%)")
-            self.f2.write(F"\n\ni. Average evaluation time: {sum(self.final_avg_time)/len(self.final_avg_time)}s")
+            # A game can end before any move, when no line can be won at all
+            self.f2.write(F"\n\ni. Average evaluation time: {average(self.final_avg_time)}s")
             self.f2.write(F"\nii. Total heuristic evaluations: {self.final_total_heuristic_evaluations}")
             self.f2.write(F"\niii. Evaluations by depth: {self.final_total_heuristic_depth}")
-            self.f2.write(F"\niv. Average evaluation depth: "
-                          F"{sum(self.final_avg_evaluation_depth)/len(self.final_avg_evaluation_depth)}")
-            # self.f2.write(F"\nv. Average recursion depth: "
-            #               F"{sum(self.final_avg_recursive_depth)/len(self.final_avg_recursive_depth)}")
-            self.f2.write(F"\nvi. Average moves per game: {sum(self.final_avg_moves)/len(self.final_avg_moves)}")
+            self.f2.write(F"\niv. Average evaluation depth: {average(self.final_avg_evaluation_depth)}")
+            self.f2.write(F"\nv. Average recursion depth: {average(self.final_avg_recursive_depth)}")
+            self.f2.write(F"\nvi. Average moves per game: {average(self.final_avg_moves)}")
             self.f2.close()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
 
 
 def main():
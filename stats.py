@@ -0,0 +1,182 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Parts of the search that are timed separately
+IS_END = 'is_end'
+HEURISTIC = 'heuristic'
+MOVE_GENERATION = 'move generation'
+
+
+class SearchStats:
+    # Statistics of the search, reported into by minimax and alphabeta. The
+    # counters of the current move are reset by new_move and added to the
+    # totals of the game by end_move. The per-move part of the trace and the
+    # 6(b) section at the end of a game are generated from them.
+    #
+    # With enabled=False every report is a no-op and timing is off, so the
+    # search only pays for the method calls.
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.timing = enabled
+        self.new_game()
+
+    def new_game(self):
+        self.moves = 0
+        self.move_times = []
+        self.game_evaluations = {}
+        self.evaluation_depths = []
+        self.recursion_depths = []
+        self.new_move()
+
+    def new_move(self):
+        # ply -> number of nodes visited / heuristic evaluations at that ply
+        self.nodes = {}
+        self.evaluations = {}
+        self.node_count = 0
+        # counted by the search engine, added in SearchEngine.flush_stats
+        self.cutoffs = 0
+        self.timeouts = 0
+        self.max_depth = 0
+        self.times = {IS_END: 0.0, HEURISTIC: 0.0, MOVE_GENERATION: 0.0}
+
+    def node(self, ply):
+        if not self.enabled:
+            return
+        self.node_count += 1
+        if ply in self.nodes:
+            self.nodes[ply] += 1
+        else:
+            self.nodes[ply] = 1
+            if ply > self.max_depth:
+                self.max_depth = ply
+
+    def evaluation(self, ply):
+        if not self.enabled:
+            return
+        if ply in self.evaluations:
+            self.evaluations[ply] += 1
+        else:
+            self.evaluations[ply] = 1
+
+    def add_time(self, part, seconds):
+        self.times[part] += seconds
+
+    # Adds the counters of the current move of other, e.g. from a worker
+    def merge(self, other):
+        for ply, count in other.nodes.items():
+            self.nodes[ply] = self.nodes.get(ply, 0) + count
+        for ply, count in other.evaluations.items():
+            self.evaluations[ply] = self.evaluations.get(ply, 0) + count
+        self.node_count += other.node_count
+        self.cutoffs += other.cutoffs
+        self.timeouts += other.timeouts
+        if other.max_depth > self.max_depth:
+            self.max_depth = other.max_depth
+        for part, seconds in other.times.items():
+            self.times[part] += seconds
+
+    def total_evaluations(self):
+        return sum(self.evaluations.values())
+
+    def average_evaluation_depth(self):
+        total = self.total_evaluations()
+        if total == 0:
+            return 0
+        return sum(k * v for k, v in self.evaluations.items()) / total
+
+    # Average depth of the nodes visited by the recursion
+    def average_recursion_depth(self):
+        if self.node_count == 0:
+            return 0
+        return sum(k * v for k, v in self.nodes.items()) / self.node_count
+
+    def end_move(self, seconds):
+        self.moves += 1
+        self.move_times.append(seconds)
+        for ply, count in self.evaluations.items():
+            self.game_evaluations[ply] = self.game_evaluations.get(ply, 0) + count
+        self.evaluation_depths.append(self.average_evaluation_depth())
+        self.recursion_depths.append(self.average_recursion_depth())
+
+    # Lines under "v. Average recursion depth" in the trace of a move
+    def move_details(self):
+        times = ', '.join(F'{part}: {round(seconds, 7)}s' for part, seconds in self.times.items())
+        return (F"\n   Nodes by depth: {self.nodes}"
+                F"\n   Max recursion depth: {self.max_depth}, cutoffs: {self.cutoffs}, timeouts: {self.timeouts}"
+                F"\n   Time in {times}")
+
+    # 6(b) section written to the trace at the end of a game
+    def game_report(self):
+        total = sum(self.game_evaluations.values())
+        return (F'\n\n6(b)i Average evaluation time:  {average(self.move_times)} s'
+                F'\n6(b)ii  Total heuristic evaluations: {total}'
+                F'\n6(b)iii Evaluations by depth: {self.game_evaluations}'
+                F'\n6(b)iv  Average evaluation depth: {average(self.evaluation_depths)}'
+                F'\n6(b)v   Average recursion depth: {average(self.recursion_depths)}'
+                F'\n6(b)vi  Total moves: {self.moves}')
+
+
+def average(values):
+    if not values:
+        return 0
+    return sum(values) / len(values)
+
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+
+
+class MoveProfiler:
+    # Profiles the search of one move, either with cProfile or by sampling
+    # the stack of the searching thread from a background thread, which
+    # doesn't slow down every function call. stop() returns the report.
+
+    def __init__(self, kind=CPROFILE, interval=0.001, top=15):
+        if kind not in (CPROFILE, SAMPLING):
+            raise ValueError(F'Unknown profiler: {kind}')
+        self.kind = kind
+        self.interval = interval
+        self.top = top
+
+    def start(self):
+        if self.kind == CPROFILE:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.samples = {}
+            self.sample_count = 0
+            self.thread_id = threading.get_ident()
+            self.running = True
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    def stop(self):
+        if self.kind == CPROFILE:
+            self.profile.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats('tottime').print_stats(self.top)
+            return out.getvalue()
+        self.running = False
+        self.sampler.join()
+        lines = [F'{self.sample_count} samples every {self.interval}s']
+        ranked = sorted(self.samples.items(), key=lambda item: -item[1])[:self.top]
+        for (function, count) in ranked:
+            lines.append(F'{count * 100 / max(self.sample_count, 1):6.1f}%  {function}')
+        return '\n'.join(lines) + '\n'
+
+    def sample(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            code = frame.f_code
+            function = F'{os.path.basename(code.co_filename)}:{code.co_name}'
+            self.samples[function] = self.samples.get(function, 0) + 1
+            self.sample_count += 1
@@ -0,0 +1,73 @@
+_symmetries = {}
+
+# The 8 rotations and reflections of an n x n board as (x, y) -> (x', y')
+TRANSFORMS = (
+    lambda n, x, y: (x, y),
+    lambda n, x, y: (y, n - 1 - x),
+    lambda n, x, y: (n - 1 - x, n - 1 - y),
+    lambda n, x, y: (n - 1 - y, x),
+    lambda n, x, y: (n - 1 - x, y),
+    lambda n, x, y: (x, n - 1 - y),
+    lambda n, x, y: (y, x),
+    lambda n, x, y: (n - 1 - y, n - 1 - x),
+)
+
+
+class Symmetry:
+    # Rotations and reflections of the board that map the block layout onto
+    # itself, built once per (n, blocks) configuration. Windows are mapped
+    # onto windows by all of them, so they preserve the game for any s.
+    # perms[k] maps a board bit index (see Board) to its image under the k-th
+    # symmetry, inverses[k] back. The identity is always perms[0].
+
+    def __init__(self, n, b_positions=()):
+        self.n = n
+        self.stride = n + 1
+        blocks = set(tuple(b) for b in b_positions)
+        self.perms = []
+        self.inverses = []
+        for transform in TRANSFORMS:
+            if set(transform(n, x, y) for (x, y) in blocks) != blocks:
+                continue
+            perm = [0] * (n * self.stride)
+            inverse = [0] * (n * self.stride)
+            for x in range(n):
+                for y in range(n):
+                    (i, j) = transform(n, x, y)
+                    perm[x * self.stride + y] = i * self.stride + j
+                    inverse[i * self.stride + j] = x * self.stride + y
+            self.perms.append(perm)
+            self.inverses.append(inverse)
+        self.size = len(self.perms)
+
+    @classmethod
+    def get(cls, n, b_positions=()):
+        key = (n, frozenset(tuple(b) for b in b_positions))
+        if key not in _symmetries:
+            _symmetries[key] = cls(n, b_positions)
+        return _symmetries[key]
+
+    # Move (x, y) of a position seen in the frame of its k-th image
+    def to_image(self, k, move):
+        if k == 0 or move is None or move[0] is None:
+            return move
+        return divmod(self.perms[k][move[0] * self.stride + move[1]], self.stride)
+
+    def from_image(self, k, move):
+        if k == 0 or move is None or move[0] is None:
+            return move
+        return divmod(self.inverses[k][move[0] * self.stride + move[1]], self.stride)
+
+    # One move of every set of moves that lead to symmetric positions, given
+    # the symmetries that leave the position itself unchanged
+    def unique_moves(self, moves, stabilizer):
+        if len(stabilizer) == 1:
+            return moves
+        perms = [self.perms[k] for k in stabilizer]
+        stride = self.stride
+        unique = []
+        for (x, y) in moves:
+            idx = x * stride + y
+            if all(perm[idx] >= idx for perm in perms):
+                unique.append((x, y))
+        return unique
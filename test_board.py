@@ -0,0 +1,175 @@
+import random
+
+from board import Board
+from evaluation import LineEvaluator
+
+
+# is_end of the original list-of-lists game, state[x][y] holding 'X', 'O',
+# '.' or '-': the winner, '.' once the board is full, else None
+def original_is_end(state, n, s):
+    # Column win
+    for column in state:
+        current = column[0]
+        count = 0
+        for i in range(len(column)):
+            if column[i] == '.' or column[i] == '-':
+                count = 0
+            elif current != column[i]:
+                count = 1
+            elif column[i] == current:
+                count += 1
+            current = column[i]
+            if count == s:
+                return current
+
+    # Horizontal win
+    for i in range(n):
+        count = 0
+        current = state[0][i]
+        for column in state:
+            if column[i] == '.' or column[i] == '-':
+                count = 0
+            elif current != column[i]:
+                count = 1
+            elif current == column[i]:
+                count += 1
+            current = column[i]
+            if count == s:
+                return current
+
+    diagonals = []
+    for start in range(n):
+        for j in range(n - s + 1):
+            diagonal = [state[start + i][i + j] for i in range(s) if 0 <= i + j < n and 0 <= start + i < n]
+            if len(diagonal) >= s:
+                diagonals.append(diagonal)
+            diagonal = [state[start + i][-i - j - 1] for i in range(s) if 0 <= i + j < n and 0 <= start + i < n]
+            if len(diagonal) >= s:
+                diagonals.append(diagonal)
+
+    for diag in diagonals:
+        if diag.count('X') == s:
+            return 'X'
+        elif diag.count('O') == s:
+            return 'O'
+
+    # Is whole board full?
+    for i in range(n):
+        for j in range(n):
+            if state[i][j] == '.':
+                return None
+    return '.'
+
+
+# True while some line of s cells holds no block and stones of one player at
+# most, found from the coordinates alone
+def winnable(state, n, s):
+    for (dx, dy) in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for x in range(n):
+            for y in range(n):
+                if not (0 <= x + (s - 1) * dx < n and 0 <= y + (s - 1) * dy < n):
+                    continue
+                cells = {state[x + k * dx][y + k * dy] for k in range(s)}
+                if '-' not in cells and not {'X', 'O'} <= cells:
+                    return True
+    return False
+
+
+def random_board(rng):
+    n = rng.randint(3, 10)
+    s = rng.randint(3, n)
+    blocks = [(rng.randrange(n), rng.randrange(n)) for _ in range(rng.randint(0, 2 * n))]
+    return Board(n, s, blocks, incremental=rng.random() < 0.8), n, s, blocks
+
+
+def check_against_original(board, n, s):
+    state = [[board.get(x, y) for y in range(n)] for x in range(n)]
+    expected = original_is_end(state, n, s)
+    status = board.status()
+    if expected is not None:
+        assert status == expected
+    else:
+        # The game also ends as a draw once no line can be won any more
+        assert status == (None if winnable(state, n, s) else '.')
+    assert board.winner() == status
+
+
+# The incremental status() against the original full scan after every place
+# and remove of random games
+def test_status_matches_original_is_end():
+    rng = random.Random(0)
+    for _ in range(300):
+        (board, n, s, blocks) = random_board(rng)
+        piece = 'X'
+        moves = []
+        check_against_original(board, n, s)
+        while board.status() is None:
+            if moves and rng.random() < 0.2:
+                board.remove(*moves.pop())
+                piece = 'O' if piece == 'X' else 'X'
+            else:
+                move = rng.choice(board.empty_cells())
+                board.place(move[0], move[1], piece)
+                moves.append(move)
+                piece = 'O' if piece == 'X' else 'X'
+            check_against_original(board, n, s)
+        while moves:
+            board.remove(*moves.pop())
+            check_against_original(board, n, s)
+
+
+# The running heuristic scores, live windows and image hashes against a full
+# recompute, on random boards reached through random make/unmake sequences
+def test_incremental_state():
+    rng = random.Random(0)
+    for _ in range(200):
+        (board, n, s, blocks) = random_board(rng)
+        evaluator = LineEvaluator.get(n, s, blocks)
+        piece = 'X'
+        moves = []
+        while True:
+            assert board.material == board.count('X') - board.count('O')
+            assert board.empty == board.full & ~(board.x | board.o | board.blocks)
+            closed = [bool(mask & board.x and mask & board.o) for mask in board.lines.masks]
+            assert board.live == closed.count(False), (n, s, blocks, moves)
+            dead = 0
+            for idx, windows in enumerate(board.lines.cell_windows):
+                if all(closed[w] for w in windows):
+                    dead |= 1 << idx
+            assert board.dead == dead & board.full, (n, s, blocks, moves)
+            if board.incremental:
+                assert board.e2_score == evaluator.score(board), (n, s, blocks, moves)
+                for side in ('X', 'O'):
+                    for k in (s - 2, s - 1):
+                        board.incremental = False
+                        expected = set(board.open_windows(side, k))
+                        board.incremental = True
+                        assert board.open_windows(side, k) == expected, (n, s, blocks, moves)
+            for k, perm in enumerate(board.symmetry.perms[1:]):
+                image = 0
+                for idx in range(len(perm)):
+                    if (board.x >> idx) & 1:
+                        image ^= board.zobrist_x[perm[idx]]
+                    elif (board.o >> idx) & 1:
+                        image ^= board.zobrist_o[perm[idx]]
+                assert board.image_hashes[k] == image, (n, s, blocks, moves)
+            empty = board.empty_cells()
+            if board.status() is not None or not empty:
+                break
+            if board.incremental:
+                scores = board.child_scores(empty, piece)
+                threats = board.child_threats(empty, piece)
+                for k, (x, y) in enumerate(empty):
+                    board.place(x, y, piece)
+                    assert scores[k] == board.e2_score, (n, s, blocks, moves, (x, y))
+                    threat = board.status() is None and bool(board.open_x[s - 1] or board.open_o[s - 1])
+                    assert threats[k] == threat, (n, s, blocks, moves, (x, y))
+                    board.remove(x, y)
+            if moves and rng.random() < 0.2:
+                board.remove(*moves.pop())
+                piece = 'O' if piece == 'X' else 'X'
+                continue
+            move = rng.choice(empty)
+            board.place(move[0], move[1], piece)
+            moves.append(move)
+            piece = 'O' if piece == 'X' else 'X'
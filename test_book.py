@@ -0,0 +1,47 @@
+from board import Board
+from book import PositionBook, write_book, book_filename, NO_MOVE, OPENING, SOLVED
+
+
+def board_with(n, s, x_cells):
+    board = Board(n, s, [])
+    for (x, y) in x_cells:
+        board.place(x, y, 'X')
+    return board
+
+
+def record(board, o_to_move, move, kind, depth, value):
+    (key, image) = board.canonical_key(o_to_move)
+    if move is None:
+        return key, (NO_MOVE, kind, depth, value)
+    (x, y) = board.symmetry.to_image(image, move)
+    return key, (x * board.n + y, kind, depth, value)
+
+
+# A written book answers for the positions it holds and for their symmetric
+# images, with the move mapped back to the board probed
+def test_write_and_probe(tmp_path):
+    path = book_filename(str(tmp_path), 4, 3, [])
+    records = dict([record(board_with(4, 3, [(0, 1)]), True, (0, 2), OPENING, 4, 30),
+                    record(board_with(4, 3, []), False, None, SOLVED, 16, 0)])
+    assert write_book(path, 4, 3, [], records) == 2
+    book = PositionBook(path, 4, 3, [])
+    try:
+        # The stone and the move under the identity, both reflections and the
+        # transposition
+        for (stone, move) in (((0, 1), (0, 2)), ((3, 1), (3, 2)), ((0, 2), (0, 1)), ((1, 0), (2, 0))):
+            assert book.probe(board_with(4, 3, [stone]), True) == (move[0], move[1], 30, OPENING, 4)
+        assert book.probe(board_with(4, 3, []), False) == (None, None, 0, SOLVED, 16)
+        # Same stones, other side to move
+        assert book.probe(board_with(4, 3, [(0, 1)]), False) is None
+        assert book.probe(board_with(4, 3, [(1, 1)]), True) is None
+    finally:
+        book.close()
+
+    # A second write keeps the records already in the file
+    write_book(path, 4, 3, [], dict([record(board_with(4, 3, [(1, 1)]), True, (2, 2), OPENING, 2, -5)]))
+    book = PositionBook.open(str(tmp_path), 4, 3, [])
+    try:
+        assert book.probe(board_with(4, 3, [(1, 1)]), True) == (2, 2, -5, OPENING, 2)
+        assert book.probe(board_with(4, 3, [(3, 2)]), True) == (3, 1, 30, OPENING, 4)
+    finally:
+        book.close()
@@ -0,0 +1,70 @@
+import io
+import random
+import time
+
+from skeleton_tictactoe import Game
+
+
+def random_game(rng, depth):
+    n = rng.randint(4, 6)
+    s = min(n, rng.randint(3, 4))
+    game = Game(recommend=False, quiet=True, ponder=False, book=None, weights=None,
+                params={'n': n, 's': s, 'd1': depth, 'd2': depth, 't': 1000, 'a1': True, 'a2': True,
+                        'e1': 2, 'e2': 2, 'trace': io.StringIO()})
+    for _ in range(rng.randint(1, 5)):
+        (x, y) = rng.choice(game.board.empty_cells())
+        game.board.place(x, y, game.player_turn)
+        if game.is_end() is not None:
+            game.board.remove(x, y)
+            continue
+        game.switch_player()
+    return game
+
+
+# The move alphabeta returns must be worth the value it reports: minimax
+# searching the position after it finds the same value
+def test_alphabeta_move_is_worth_its_value():
+    rng = random.Random(3)
+    depth = 3
+    for _ in range(40):
+        game = random_game(rng, depth)
+        max = game.player_turn == 'O'
+        (x, y, value) = game.search(game.ALPHABETA, max=max)
+        game.board.place(x, y, game.player_turn)
+        game.tt.clear()
+        assert game.minimax(max=not max, count=1, max_depth=depth)[2] == value
+
+
+# With s > n no line can be won: the game is a tie before any move and the
+# scoreboard still gets written
+def test_game_without_winnable_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    game = Game(recommend=False, quiet=True, ponder=False, book=None, weights=None,
+                params={'n': 3, 's': 4, 'd1': 2, 'd2': 2, 't': 1, 'a1': True, 'a2': True, 'e1': 1, 'e2': 2})
+    game.play()
+    game.write_scoreboard()
+    assert game.board.empty_cells() == [(x, y) for x in range(3) for y in range(3)]
+    assert 'Average moves per game' in (tmp_path / 'scoreboard.txt').read_text()
+
+
+# MCTS stops its playouts, in every worker, in time for the move to be
+# returned within the budget. The median move is checked as a busy machine
+# can hold up any one of them.
+def test_mcts_keeps_to_the_time_budget():
+    for workers in (1, 2):
+        game = Game(recommend=False, quiet=True, ponder=False, book=None, weights=None, workers=workers,
+                    params={'n': 10, 's': 5, 'd1': 4, 'd2': 4, 't': 0.3, 'a1': 'mcts', 'a2': 'mcts', 'e1': 2,
+                            'e2': 2, 'trace': io.StringIO()})
+        times = []
+        try:
+            for _ in range(5):
+                max = game.player_turn == 'O'
+                start = time.time()
+                (x, y, value) = game.search(game.MCTS, max)
+                times.append(time.time() - start)
+                game.board.place(x, y, game.player_turn)
+                game.switch_player()
+        finally:
+            if game.pool is not None:
+                game.pool.terminate()
+        assert sorted(times)[len(times) // 2] < game.t, (workers, times)
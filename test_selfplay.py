@@ -0,0 +1,35 @@
+import os
+
+import selfplay
+
+
+# The tuned weights must score for O, the maximising player of the search:
+# negative weights, and the positions O went on to win score above the ones
+# X won
+def test_tuned_weights_favour_the_maximiser(tmp_path):
+    path = selfplay.dataset_filename(str(tmp_path), 6, 4, [])
+    selfplay.generate(6, 4, [], 40, 1, 2, 1, 2, 0.05, 0, None, path)
+    (weights_path, weights, _, _, _, after) = selfplay.tune(6, 4, [path], selfplay.LOGISTIC, str(tmp_path))
+    assert os.path.exists(weights_path)
+    assert all(w < 0 for w in weights[1:])
+    assert after > 0.5
+    (rows, targets) = selfplay.training_set(6, 4, [], selfplay.read_positions(path)[3])
+    scores = {0: [], 1: []}
+    for (f, y) in zip(rows, targets):
+        if y != 0.5:
+            scores[y].append(sum(weights[i + 1] * f[i] for i in range(len(f))))
+    assert sum(scores[1]) / len(scores[1]) > sum(scores[0]) / len(scores[0])
+
+
+def test_generate_checks_its_parameters(tmp_path):
+    path = str(tmp_path / 'games.bin')
+    for (n, s, blocks, games) in ((3, 4, [], 1), (11, 4, [], 1), (4, 3, [(4, 0)], 1), (4, 3, [(0, 0), (0, 0)], 1),
+                                  (4, 3, [], 0)):
+        try:
+            selfplay.generate(n, s, blocks, games, 1, 2, 1, 2, 0.05, 0, None, path)
+        except ValueError:
+            continue
+        raise AssertionError((n, s, blocks, games))
+    # Blocks leaving no line to win end the games before the first move
+    assert selfplay.generate(3, 3, [(0, 0), (1, 1), (2, 2)], 2, 1, 2, 1, 2, 0.05, 0, None, path) == \
+        (0, {1: 0, -1: 0, 0: 2})
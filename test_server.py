@@ -0,0 +1,57 @@
+import json
+
+import server
+
+
+def request(e, **fields):
+    task = dict({'id': e, 'n': 5, 's': 4, 'moves': [[2, 2], [1, 1]], 'd': 4, 't': 60, 'e': e}, **fields)
+    return server.parse_request(task)
+
+
+def answer(response):
+    return response['x'], response['y'], response['value']
+
+
+# A warm game searched with one heuristic must not answer for the other from
+# its tables
+def test_heuristics_do_not_share_tables():
+    for moves in ([[2, 2], [1, 1]], [[2, 2]], [[0, 0], [2, 2], [4, 4]]):
+        server._games.clear()
+        cold = server.search_position(request(2, moves=moves))
+        server._games.clear()
+        server.search_position(request(1, moves=moves))
+        warm = server.search_position(request(2, moves=moves))
+        assert 'error' not in warm
+        assert answer(warm) == answer(cold)
+        assert warm['evaluations'] > 0
+
+
+def test_configuration_includes_heuristic():
+    assert server.configuration(request(1)) != server.configuration(request(2))
+
+
+def test_invalid_requests():
+    for fields in ({'moves': [[0, 0], [0, 0]]}, {'e': 3}, {'d': 0}, {'n': 11}, {'board': {'a': 1}},
+                   {'board': ['X..', ['.', '.', '.'], '...']}, {'board': ['X..', '...']}):
+        try:
+            request(fields.pop('e', 2), **fields)
+        except ValueError:
+            continue
+        raise AssertionError(fields)
+
+
+# A request that can't be read is answered with an error and the requests
+# after it are still served
+def test_bad_request_does_not_stop_the_server():
+    lines = ['{"id": 3, "s": 3, "board": {"a": 1}}\n', '{"id": 4, "s": 3, "moves": [["a", "b"]], "n": 3}\n',
+             '{"id": 5, "command": "ping"}\n']
+    output = []
+    engine = server.EngineServer(1)
+    try:
+        engine.serve(lines, output.append)
+    finally:
+        engine.close()
+    responses = [json.loads(line) for line in output]
+    assert [response['id'] for response in responses] == [3, 4, 5]
+    assert 'error' in responses[0] and 'error' in responses[1]
+    assert responses[2]['pong']
@@ -0,0 +1,63 @@
+import io
+import random
+
+from board import Board
+from skeleton_tictactoe import Game
+from symmetry import TRANSFORMS
+
+
+def board_of(n, s, blocks, x_cells, o_cells):
+    board = Board(n, s, blocks)
+    for (x, y) in x_cells:
+        board.place(x, y, 'X')
+    for (x, y) in o_cells:
+        board.place(x, y, 'O')
+    return board
+
+
+# Every rotation and reflection that keeps the blocks in place gives the
+# position the same canonical key, which still tells the side to move
+def test_symmetric_positions_share_the_canonical_key():
+    rng = random.Random(0)
+    for _ in range(100):
+        n = rng.randint(3, 8)
+        s = rng.randint(3, n)
+        blocks = rng.choice(([], [(0, 0), (n - 1, n - 1)], [(n // 2, n // 2)]))
+        cells = [(x, y) for x in range(n) for y in range(n) if (x, y) not in blocks]
+        rng.shuffle(cells)
+        stones = rng.randint(0, len(cells) // 2)
+        (x_cells, o_cells) = (cells[:stones], cells[stones:2 * stones])
+        board = board_of(n, s, blocks, x_cells, o_cells)
+        keys = (board.canonical_key(False)[0], board.canonical_key(True)[0])
+        assert keys[0] != keys[1]
+        for transform in TRANSFORMS:
+            image = sorted(transform(n, x, y) for (x, y) in blocks)
+            if image != sorted(blocks):
+                continue
+            other = board_of(n, s, blocks, [transform(n, x, y) for (x, y) in x_cells],
+                             [transform(n, x, y) for (x, y) in o_cells])
+            assert (other.canonical_key(False)[0], other.canonical_key(True)[0]) == keys
+
+
+# The entry a search stores for a position is found from each of its images,
+# and its move mapped back to the frame of the image is the image of the move
+def test_symmetric_positions_share_a_table_entry():
+    (n, x_cells, o_cells) = (5, [(0, 1), (1, 3)], [(2, 2)])
+    game = Game(recommend=False, quiet=True, ponder=False, book=None, weights=None,
+                params={'n': n, 's': 4, 'd1': 3, 'd2': 3, 't': 1000, 'a1': True, 'a2': True, 'e1': 2, 'e2': 2,
+                        'trace': io.StringIO()})
+    for (x, y) in x_cells:
+        game.board.place(x, y, 'X')
+    for (x, y) in o_cells:
+        game.board.place(x, y, 'O')
+    game.player_turn = 'O'
+    (x, y, value) = game.search(game.ALPHABETA, max=True)
+    (key, image) = game.board.canonical_key(True)
+    entry = game.tt.probe(key)
+    assert game.board.symmetry.from_image(image, entry[4]) == (x, y)
+    for transform in TRANSFORMS:
+        other = board_of(n, 4, [], [transform(n, i, j) for (i, j) in x_cells],
+                         [transform(n, i, j) for (i, j) in o_cells])
+        (other_key, other_image) = other.canonical_key(True)
+        assert game.tt.probe(other_key) == entry
+        assert other.symmetry.from_image(other_image, entry[4]) == transform(n, x, y)
@@ -0,0 +1,38 @@
+import time
+
+
+class TimeManager:
+    # Keeps the wall-clock budget of one move. The search asks expired() every
+    # few nodes to abort a running iteration, and the iterative deepening
+    # driver asks can_start_iteration() so that it does not start a deeper
+    # iteration that has no chance of finishing in the time left.
+
+    def __init__(self, margin=0.005, growth=3.0):
+        # margin is kept back for returning the move, growth is the assumed
+        # ratio between two consecutive iteration times until one is measured
+        self.margin = margin
+        self.growth = growth
+        self.deadline = 0.0
+        self.iteration_times = []
+
+    def start(self, budget):
+        self.deadline = time.time() + budget - self.margin
+        self.iteration_times = []
+
+    def remaining(self):
+        return self.deadline - time.time()
+
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def end_iteration(self, duration):
+        self.iteration_times.append(duration)
+
+    def can_start_iteration(self):
+        if not self.iteration_times:
+            return not self.expired()
+        last = self.iteration_times[-1]
+        growth = self.growth
+        if len(self.iteration_times) > 1 and self.iteration_times[-2] > 0:
+            growth = max(1.5, last / self.iteration_times[-2])
+        return last * growth < self.remaining()
@@ -0,0 +1,213 @@
+#!/usr/bin/env pypy
+# Headless AI vs AI tournaments. Every combination of the given parameters is
+# a configuration; r games are played per configuration with the players
+# swapping sides every other game. Traces go to the usual gameTrace-*.txt
+# files and one scoreboard per configuration is appended to scoreboard.txt.
+# --jsonl also writes the structured gameTrace-*.jsonl traces.
+#
+#   pypy tournament.py --n 4 5 --s 3 --d1 2 4 --d2 4 --t 1 --e1 1 --e2 2 -r 10
+#   pypy tournament.py --config nightly.json --workers 8
+#
+# A config file holds the same keys as the options, parameter values may be
+# single values or lists, e.g. {"r": 10, "matrix": {"n": [4, 5], "s": 3}}.
+# "configs" lists configurations one by one instead of as a matrix.
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import random
+
+from book import parse_blocks
+from skeleton_tictactoe import Game
+
+PARAMETERS = ('n', 'b', 'blocks', 's', 'd1', 'd2', 't', 'a1', 'a2', 'e1', 'e2')
+DEFAULTS = {'n': 3, 'b': 0, 'blocks': None, 's': 3, 'd1': 4, 'd2': 4, 't': 5,
+            'a1': 'alphabeta', 'a2': 'alphabeta', 'e1': 1, 'e2': 2}
+
+
+def parse_algorithm(value):
+    if isinstance(value, bool):
+        return value
+    if value in ('alphabeta', 'ab', '2', 2):
+        return True
+    if value in ('minimax', 'mm', '1', 1):
+        return False
+    if value in ('pvs', 'negascout', '3', 3):
+        return 'pvs'
+    if value in ('mcts', 'uct', '4', 4):
+        return 'mcts'
+    raise ValueError(F'Unknown algorithm: {value}')
+
+
+# A single block layout is a string or a list of [x, y] pairs
+def is_layout(value):
+    if isinstance(value, str) or value is None:
+        return True
+    return not value or isinstance(value[0], (list, tuple)) and value[0] and isinstance(value[0][0], int)
+
+
+def expand(matrix):
+    values = []
+    for name in PARAMETERS:
+        value = matrix.get(name, DEFAULTS[name])
+        if name == 'blocks' and is_layout(value) or name != 'blocks' and not isinstance(value, list):
+            value = [value]
+        values.append(value)
+    for combination in itertools.product(*values):
+        yield dict(zip(PARAMETERS, combination))
+
+
+# Turns one configuration into Game parameters, None if it isn't playable
+def to_params(config, rng):
+    n = config['n']
+    if not 3 <= n <= 10 or not 3 <= config['s'] <= n:
+        return None
+    if config['blocks'] is not None:
+        b_positions = parse_blocks(config['blocks'])
+    else:
+        if config['b'] > 2 * n:
+            return None
+        cells = [(x, y) for x in range(n) for y in range(n)]
+        b_positions = rng.sample(cells, config['b'])
+    if any(not (0 <= x < n and 0 <= y < n) for (x, y) in b_positions):
+        return None
+    return {'n': n, 'b_positions': b_positions, 's': config['s'], 'd1': config['d1'], 'd2': config['d2'],
+            't': config['t'], 'a1': parse_algorithm(config['a1']), 'a2': parse_algorithm(config['a2']),
+            'e1': int(config['e1']), 'e2': int(config['e2'])}
+
+
+def swap_sides(params):
+    params = dict(params)
+    params['d1'], params['d2'] = params['d2'], params['d1']
+    params['a1'], params['a2'] = params['a2'], params['a1']
+    params['e1'], params['e2'] = params['e2'], params['e1']
+    return params
+
+
+# Plays one game in a worker process and sends back its traces and statistics
+def play_game(task):
+    (params, number, structured) = task
+    trace = io.StringIO()
+    records = io.StringIO()
+    game = Game(recommend=False, quiet=True, structured=structured,
+                params=dict(params, trace=trace, records=records))
+    game.num_of_games = number - 1
+    game.play()
+    game.close_trace()
+    return {
+        'trace': trace.getvalue(),
+        'records': records.getvalue(),
+        'result': game.result,
+        'e1_wins': game.e1_wins,
+        'e2_wins': game.e2_wins,
+        'final_avg_moves': game.final_avg_moves,
+        'final_avg_time': game.final_avg_time,
+        'final_total_heuristic_evaluations': game.final_total_heuristic_evaluations,
+        'final_total_heuristic_depth': game.final_total_heuristic_depth,
+        'final_avg_evaluation_depth': game.final_avg_evaluation_depth,
+        'final_avg_recursive_depth': game.final_avg_recursive_depth,
+    }
+
+
+def run_configuration(params, rounds, map_function, structured=False):
+    tasks = []
+    for i in range(rounds):
+        if i % 2:
+            tasks.append((swap_sides(params), i + 1, structured))
+        else:
+            tasks.append((params, i + 1, structured))
+    results = list(map_function(play_game, tasks))
+
+    # The scoreboard is written by a game holding the totals of all games
+    scoreboard = Game(recommend=False, quiet=True, params=dict(params, trace=io.StringIO()))
+    with open(scoreboard.trace_filename(), "a") as f:
+        f.write(''.join(result['trace'] for result in results))
+    if structured:
+        with open(scoreboard.records_filename(), "a") as f:
+            f.write(''.join(result['records'] for result in results))
+    scoreboard.num_of_games = rounds
+    for result in results:
+        scoreboard.e1_wins += result['e1_wins']
+        scoreboard.e2_wins += result['e2_wins']
+        scoreboard.final_avg_moves += result['final_avg_moves']
+        scoreboard.final_avg_time += result['final_avg_time']
+        scoreboard.final_total_heuristic_evaluations += result['final_total_heuristic_evaluations']
+        for depth, count in result['final_total_heuristic_depth'].items():
+            if depth in scoreboard.final_total_heuristic_depth.keys():
+                scoreboard.final_total_heuristic_depth[depth] += count
+            else:
+                scoreboard.final_total_heuristic_depth[depth] = count
+        scoreboard.final_avg_evaluation_depth += result['final_avg_evaluation_depth']
+        scoreboard.final_avg_recursive_depth += result['final_avg_recursive_depth']
+    scoreboard.write_scoreboard()
+    ties = sum(1 for result in results if result['result'] == '.')
+    return scoreboard.e1_wins, scoreboard.e2_wins, ties
+
+
+def run(configs, rounds, workers=1, seed=0, structured=False):
+    rng = random.Random(seed)
+    pool = None
+    map_function = map
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        map_function = pool.map
+    try:
+        for config in configs:
+            params = to_params(config, rng)
+            if params is None:
+                print(F'Skipping invalid configuration {config}')
+                continue
+            (e1_wins, e2_wins, ties) = run_configuration(params, rounds, map_function, structured)
+            print(F"n={params['n']} b={len(params['b_positions'])} s={params['s']} t={params['t']} "
+                  F"d={params['d1']}/{params['d2']} a={params['a1']}/{params['a2']} e{params['e1']}/e{params['e2']}: "
+                  F"e1 {e1_wins} wins, e2 {e2_wins} wins, {ties} ties")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play AI vs AI tournaments without any questions.')
+    parser.add_argument('--config', help='JSON file with the tournament configuration')
+    parser.add_argument('--n', type=int, nargs='+', help='board sizes')
+    parser.add_argument('--b', type=int, nargs='+', help='numbers of randomly placed blocks')
+    parser.add_argument('--blocks', nargs='+', help='block layouts such as "0,0 3,3"')
+    parser.add_argument('--s', type=int, nargs='+', help='winning line-up sizes')
+    parser.add_argument('--d1', type=int, nargs='+', help='max depths of player 1')
+    parser.add_argument('--d2', type=int, nargs='+', help='max depths of player 2')
+    parser.add_argument('--t', type=int, nargs='+', help='time budgets per move in seconds')
+    parser.add_argument('--a1', nargs='+', help='minimax, alphabeta, pvs or mcts for player 1')
+    parser.add_argument('--a2', nargs='+', help='minimax, alphabeta, pvs or mcts for player 2')
+    parser.add_argument('--e1', type=int, nargs='+', help='heuristics of player 1')
+    parser.add_argument('--e2', type=int, nargs='+', help='heuristics of player 2')
+    parser.add_argument('-r', '--rounds', type=int, help='games per configuration (default 2)')
+    parser.add_argument('--workers', type=int, help='games played at the same time (default 1)')
+    parser.add_argument('--seed', type=int, help='seed for random block positions (default 0)')
+    parser.add_argument('--jsonl', action='store_true', help='also write JSON Lines traces')
+    args = parser.parse_args()
+
+    settings = {}
+    if args.config:
+        with open(args.config) as f:
+            settings = json.load(f)
+    matrix = dict(settings.get('matrix', {}))
+    for name in PARAMETERS:
+        value = getattr(args, name)
+        if value is not None:
+            matrix[name] = value
+    if 'configs' in settings and not any(getattr(args, name) is not None for name in PARAMETERS):
+        configs = [dict(DEFAULTS, **config) for config in settings['configs']]
+    else:
+        configs = list(expand(matrix))
+
+    rounds = args.rounds or settings.get('r', 2)
+    workers = args.workers or settings.get('workers', 1)
+    seed = args.seed if args.seed is not None else settings.get('seed', 0)
+    structured = args.jsonl or settings.get('jsonl', False)
+    run(configs, rounds, workers, seed, structured)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Bound types stored with every entry
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Replacement policies when two positions map to the same slot
+DEPTH_PREFERRED = 'depth'
+ALWAYS_REPLACE = 'always'
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the Zobrist key of the position. Each
+    # slot holds (key, depth, value, bound, move, age) where depth is the
+    # remaining search depth below the position, move is the best (x, y)
+    # found and age the age of the search that stored it. Tables are kept
+    # from one move to the next, the depth-preferred policy doesn't protect
+    # entries of an earlier age so that deep entries of positions the game
+    # has left behind don't fill the table.
+
+    def __init__(self, size=1 << 18, policy=DEPTH_PREFERRED):
+        if policy not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError(F'Unknown replacement policy: {policy}')
+        self.size = size
+        self.policy = policy
+        self.slots = [None] * size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.reset_counters()
+
+    # age grows during a game, the number of stones at the root will do
+    def new_search(self, age):
+        self.age = age
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def probe(self, key):
+        entry = self.slots[key % self.size]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != key:
+            # Another position owns the slot
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, depth, value, bound, move):
+        slot = key % self.size
+        entry = self.slots[slot]
+        if entry is not None and self.policy == DEPTH_PREFERRED and entry[0] != key and entry[1] > depth \
+                and entry[5] >= self.age:
+            return
+        self.slots[slot] = (key, depth, value, bound, move, self.age)